@@ -2,6 +2,8 @@ import os
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown, worker_ready
+from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'admanager.settings')
@@ -17,13 +19,50 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+
+def tick(task, schedule=None):
+    # Ticks still queued when the next one is due are dropped by the broker,
+    # a backlog behind a slow run collapses into a single run.
+    schedule = schedule or settings.TICK_INTERVAL
+    return {'task': task, 'schedule': schedule, 'options': {'expires': schedule}}
+
+
 app.conf.beat_schedule = {
-    'check-brand-budgets-every-hour': {
-        'task': 'api.tasks.update_brand_spend',
-        'schedule': 10.0,
-    },
-    'enforce-dayparting-every-15-mins': {
-        'task': 'api.tasks.ad_scheduler',
-        'schedule': 10.0,
-    },
-}
\ No newline at end of file
+    'check-brand-budgets-every-hour': tick('api.tasks.task_update_brand_spend'),
+    'update-ad-spend': tick('api.tasks.task_update_adspend'),
+}
+
+if settings.BRAND_FANOUT_ENABLED:
+    # Each shard accrues, rolls up and schedules its own brands.
+    app.conf.beat_schedule = {
+        'process-brand-shards': tick('api.tasks.task_fanout_brands'),
+    }
+elif settings.AD_TIMELINE_ENABLED:
+    app.conf.beat_schedule['plan-ad-timeline'] = tick('api.tasks.task_plan_timeline', settings.AD_TIMELINE_HORIZON)
+else:
+    app.conf.beat_schedule['enforce-dayparting-every-15-mins'] = tick('api.tasks.task_ad_scheduler')
+
+if settings.BUDGET_COUNTER_BACKEND:
+    app.conf.beat_schedule['sync-budget-counters'] = tick(
+        'api.tasks.task_sync_budget_counters', settings.BUDGET_COUNTER_SYNC_INTERVAL
+    )
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    # Task metrics of the worker, scraped separately from the web app's /metrics.
+    if settings.WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+        from api.metrics import metrics_registry
+
+        start_http_server(settings.WORKER_METRICS_PORT, registry=metrics_registry())
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from api.metrics import MULTIPROCESS
+
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -95,6 +95,28 @@ if 'test' in sys.argv or 'test_coverage' in sys.argv:
     DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
 
 
+# Shared cache for the ad timeline watermark and brand budget state. Without
+# CACHE_URL every process has its own local memory cache.
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        }
+    }
+
+# Brand budget state is cached per process (an LRU of this many brands, kept
+# this many seconds) on top of the shared cache.
+BRAND_STATE_LOCAL_SIZE = int(os.environ.get('BRAND_STATE_LOCAL_SIZE', 10000))
+BRAND_STATE_LOCAL_TTL = float(os.environ.get('BRAND_STATE_LOCAL_TTL', 5.0))
+BRAND_STATE_CACHE_TTL = int(os.environ.get('BRAND_STATE_CACHE_TTL', 300))
+
+# Cache each brand and ad the read endpoints serialize, keyed by its brand
+# version, for this many seconds. Off, only 304s skip serialization.
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'False') == 'True'
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -114,6 +136,12 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -137,8 +165,55 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DEFAULT_HOURLY_RATE = os.environ.get('DEFAULT_HOURLY_RATE', 1.00)
+# Seconds a process keeps the hourly rate history before reloading it.
+RATE_CACHE_TTL = float(os.environ.get('RATE_CACHE_TTL', 60.0))
+
+# How task_update_adspend accounts active time: 'recompute' rebuilds today's
+# spend from midnight or the last activation, 'incremental' adds the time
+# elapsed since each ad's spend watermark.
+ADSPEND_ACCRUAL_MODE = os.environ.get('ADSPEND_ACCRUAL_MODE', 'recompute')
 
 # Celery Configuration Options
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
 CELERY_TASK_TRACK_STARTED = True
-CELERY_TASK_TIME_LIMIT = 30 * 60
\ No newline at end of file
+CELERY_TASK_TIME_LIMIT = 30 * 60
+
+# Optional live budget counters, e.g. 'api.budget.RedisBudgetCounters' or
+# 'api.budget.InMemoryBudgetCounters'. Empty keeps budgets in Postgres only.
+BUDGET_COUNTER_BACKEND = os.environ.get('BUDGET_COUNTER_BACKEND', '')
+BUDGET_COUNTER_URL = os.environ.get('BUDGET_COUNTER_URL', CELERY_BROKER_URL)
+BUDGET_COUNTER_SYNC_INTERVAL = float(os.environ.get('BUDGET_COUNTER_SYNC_INTERVAL', 30.0))
+
+# Replace the 10 second ad scheduler poll with ETA tasks planned at the exact
+# instants ads start, end or budgets reset. The planner runs this often and
+# looks twice as far ahead.
+AD_TIMELINE_ENABLED = os.environ.get('AD_TIMELINE_ENABLED', 'False') == 'True'
+AD_TIMELINE_HORIZON = float(os.environ.get('AD_TIMELINE_HORIZON', 300.0))
+
+# Fan the periodic spend/scheduling work out to every worker: a coordinator
+# splits brands into id ranges of this size and runs them as a Celery chord.
+BRAND_FANOUT_ENABLED = os.environ.get('BRAND_FANOUT_ENABLED', 'False') == 'True'
+BRAND_SHARD_SIZE = int(os.environ.get('BRAND_SHARD_SIZE', 500))
+
+# Periodic tasks run every TICK_INTERVAL seconds and are single-flight: a tick
+# that finds the previous run still going is skipped. Locks and run stats live
+# in TICK_GUARD_BACKEND, shared by every worker.
+TICK_INTERVAL = float(os.environ.get('TICK_INTERVAL', 10.0))
+TICK_GUARD_URL = os.environ.get('TICK_GUARD_URL', CELERY_BROKER_URL)
+TICK_GUARD_BACKEND = os.environ.get('TICK_GUARD_BACKEND', 'api.ticks.RedisTickStore')
+
+# Optional change feed: ad activations, deactivations and exhausted budgets are
+# appended to EVENT_LOG_BACKEND, e.g. 'api.events.RedisEventLog' or
+# 'api.events.InMemoryEventLog', and served at /api/events/. Only the newest
+# EVENT_LOG_MAXLEN events are kept. Empty publishes nothing.
+EVENT_LOG_BACKEND = os.environ.get('EVENT_LOG_BACKEND', '')
+EVENT_LOG_URL = os.environ.get('EVENT_LOG_URL', CELERY_BROKER_URL)
+EVENT_LOG_MAXLEN = int(os.environ.get('EVENT_LOG_MAXLEN', 100000))
+
+# Port of the Prometheus endpoint Celery workers serve their task metrics on,
+# 0 disables it. The web app serves its own at /metrics.
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 0))
+
+if 'test' in sys.argv or 'test_coverage' in sys.argv:
+    TICK_GUARD_BACKEND = 'api.ticks.LocalTickStore'
@@ -17,14 +17,32 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from api.viewsets import SettingsViewSet, BrandViewSet, AdViewSet
+from api.async_views import (
+    AsyncBrandList, AsyncBrandDetail, AsyncBrandSpend, AsyncBulkBrandSpend, AsyncAdList, AsyncAdDetail, EventsView,
+)
+from api.views import metrics
+from api.viewsets import SettingsViewSet, BrandViewSet, AdViewSet, TickStatsViewSet, ExportViewSet, IngestViewSet
 
 router = DefaultRouter()
 router.register(r'settings', SettingsViewSet)
 router.register(r'brands', BrandViewSet)
 router.register(r'ads', AdViewSet)
+router.register(r'ticks', TickStatsViewSet, basename='ticks')
+router.register(r'exports', ExportViewSet, basename='exports')
+router.register(r'ingest', IngestViewSet, basename='ingest')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/events/', EventsView.as_view()),
     path('api/', include(router.urls)),
+    # Async copies of the read endpoints, for the ASGI server (admanager.asgi).
+    path('api/async/', include([
+        path('brands/', AsyncBrandList.as_view()),
+        path('brands/spend/', AsyncBulkBrandSpend.as_view()),
+        path('brands/<int:pk>/', AsyncBrandDetail.as_view()),
+        path('brands/<int:pk>/spend/', AsyncBrandSpend.as_view()),
+        path('ads/', AsyncAdList.as_view()),
+        path('ads/<int:pk>/', AsyncAdDetail.as_view()),
+    ])),
+    path('metrics', metrics),
 ]
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from datetime import timedelta
+from decimal import Decimal
+from math import ceil
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .budget import get_budget_counters
+from .events import budget_exhausted_events, publish
+from .models import Ad, AdSpend, Brand, BrandDailySpend
+from .rates import rate_table
+from .scheduler import flip_ads
+
+ACCRUAL_MODES = ('recompute', 'incremental')
+BATCH_SIZE = 1000
+
+
+@dataclass
+class AccrualResult:
+    ads: int = 0
+    written: int = 0
+    accumulated: int = 0
+    budgets_exhausted: int = 0
+    ads_deactivated: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def split_by_day(start, end):
+    """Yield (date, seconds) for every calendar day touched by [start, end)."""
+    while start < end:
+        next_day = (start + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        chunk_end = min(end, next_day)
+        yield start.date(), int((chunk_end - start).total_seconds())
+        start = chunk_end
+
+
+def _batches(items, size=BATCH_SIZE):
+    for idx in range(0, len(items), size):
+        yield items[idx:idx + size]
+
+
+def _recompute_seconds(active_ads, now):
+    # Legacy formula: today's spend is the time since midnight or since the
+    # last activation, whichever is later. Earlier intervals of the day are lost.
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = {}
+    for ad_id, _, last_active_time, _ in active_ads:
+        start_time = last_active_time if last_active_time and last_active_time > today else today
+        seconds[(ad_id, today.date())] = max(ceil((now - start_time).total_seconds()), 0)
+    return seconds
+
+
+def _incremental_seconds(active_ads, now):
+    # Only the time since the last accounted instant is added. A watermark
+    # older than the last activation belongs to a previous active interval.
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = {}
+    for ad_id, _, last_active_time, watermark in active_ads:
+        since = max(filter(None, (watermark, last_active_time)), default=today)
+        for day, delta in split_by_day(since, now):
+            seconds[(ad_id, day)] = delta
+    return seconds
+
+
+def accrue_ad_spend(now=None, mode=None, ads=None):
+    """
+    Account active time of every active ad into `AdSpend` rows.
+
+    In 'recompute' mode today's row is overwritten; in 'incremental' mode the
+    elapsed time since each ad's `spend_watermark` is added to the rows of
+    the days it spans. Both modes advance the watermark. Spend is the started hours of the day times that
+    day's hourly rate. Rows are upserted on (ad, date) in batches and the
+    spend difference is applied to `BrandDailySpend` in the same transaction.
+    Days with externally reported spend are left as ingested.
+    `ads` narrows the run to a subset of the catalog.
+    """
+    now = now or timezone.now()
+    mode = mode or settings.ADSPEND_ACCRUAL_MODE
+    if mode not in ACCRUAL_MODES:
+        raise ValueError(f"Unknown accrual mode '{mode}', expected one of {ACCRUAL_MODES}.")
+
+    incremental = mode == 'incremental'
+    if incremental:
+        # Watermarks advance in whole seconds so no fraction is ever dropped twice.
+        now = now.replace(microsecond=0)
+
+    ads = Ad.objects.all() if ads is None else ads
+    active_ads = list(ads.filter(active=True).values_list('id', 'brand_id', 'last_active_time', 'spend_watermark'))
+    result = AccrualResult(ads=len(active_ads))
+    if not active_ads:
+        return result
+
+    if incremental:
+        seconds = _incremental_seconds(active_ads, now)
+    else:
+        seconds = _recompute_seconds(active_ads, now)
+
+    brand_of = {ad_id: brand_id for ad_id, brand_id, _, _ in active_ads}
+    ad_ids = list(brand_of)
+    dates = {day for _, day in seconds}
+
+    with transaction.atomic():
+        previous = {}
+        for batch in _batches(ad_ids):
+            existing = AdSpend.objects.select_for_update().filter(ad_id__in=batch, date__in=dates)
+            for ad_id, day, active_seconds, spent, reported in existing.values_list(
+                'ad_id', 'date', 'active_seconds', 'spent', 'reported'
+            ):
+                if reported:
+                    # Reported spend takes precedence over accrued time.
+                    seconds.pop((ad_id, day), None)
+                    continue
+                previous[(ad_id, day)] = spent
+                if incremental and (ad_id, day) in seconds:
+                    # Deltas are added to what is already stored for that day.
+                    seconds[(ad_id, day)] += active_seconds
+                    result.accumulated += 1
+
+        rows = []
+        deltas = defaultdict(Decimal)
+        rates = rate_table()
+        for (ad_id, day), total in seconds.items():
+            # Billed in started hours at the rate of that day.
+            spent = rates.price(ceil(total / 3600), day)
+            rows.append(AdSpend(ad_id=ad_id, date=day, active_seconds=total, spent=spent))
+            deltas[(brand_of[ad_id], day)] += spent - previous.get((ad_id, day), 0)
+
+        AdSpend.objects.bulk_create(
+            rows,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['ad', 'date'],
+            update_fields=['active_seconds', 'spent'],
+        )
+        BrandDailySpend.apply_deltas(deltas)
+
+        # Advanced in both modes, so switching to incremental continues from
+        # what recompute stored. Not part of the ads' API representation, so
+        # no brand is bumped.
+        for batch in _batches(ad_ids):
+            Ad.objects.filter(pk__in=batch).update(spend_watermark=now)
+
+    result.written = len(rows)
+
+    counters = get_budget_counters()
+    if counters is not None:
+        # Run inside a caller's transaction (a brand shard), wait for it to commit.
+        transaction.on_commit(lambda: enforce_live_budgets(counters, deltas, result, now))
+
+    return result
+
+
+def enforce_live_budgets(counters, deltas, result, now=None):
+    # Counters are only fed committed spend, then the ads of every brand they
+    # report as newly exhausted are stopped right away instead of next rollup.
+    brands = Brand.objects.filter(pk__in={brand_id for brand_id, _ in deltas})
+    budgets = {
+        brand_id: (daily_budget, monthly_budget)
+        for brand_id, daily_budget, monthly_budget in brands.values_list('id', 'daily_budget', 'monthly_budget')
+    }
+    exhausted = counters.add_spend({
+        (brand_id, day): (delta, *budgets[brand_id])
+        for (brand_id, day), delta in deltas.items()
+        if brand_id in budgets
+    })
+    if exhausted:
+        now = now or timezone.now()
+        result.budgets_exhausted = len(exhausted)
+        with transaction.atomic():
+            publish(budget_exhausted_events(exhausted, now))
+            result.ads_deactivated = flip_ads(
+                Ad.objects.filter(brand_id__in=exhausted, active=True), now, 'ad.deactivated', 'budget', active=False
+            )
@@ -1,10 +1,14 @@
 from django.contrib import admin
-from .models import Settings, Brand, Ad
+from .models import Settings, HourlyRate, Brand, Ad
 
 @admin.register(Settings)
 class SettingsAdmin(admin.ModelAdmin):
     list_display = ('hourly_rate',)
 
+@admin.register(HourlyRate)
+class HourlyRateAdmin(admin.ModelAdmin):
+    list_display = ('effective_date', 'rate')
+
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'daily_budget', 'monthly_budget')
@@ -0,0 +1,49 @@
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from .models import BrandDailySpend
+
+GRANULARITIES = ('day', 'month')
+
+
+def spend_history_rows(brand_ids, granularity='day', start=None, end=None):
+    """Unevaluated `(brand_id, period, spent)` rows behind `brand_spend_history`."""
+    spends = BrandDailySpend.objects.filter(brand__in=brand_ids)
+    if start is not None:
+        spends = spends.filter(date__gte=start)
+    if end is not None:
+        spends = spends.filter(date__lte=end)
+
+    if granularity == 'month':
+        return (
+            spends.annotate(period=TruncMonth('date'))
+            .values('brand', 'period')
+            .annotate(total=Sum('spent'))
+            .values_list('brand', 'period', 'total')
+            .order_by('brand', 'period')
+        )
+    return spends.values_list('brand', 'date', 'spent').order_by('brand', 'date')
+
+
+def _group_by_brand(brand_ids, rows):
+    history = {brand_id: [] for brand_id in brand_ids}
+    for brand_id, period, spent in rows:
+        history[brand_id].append((period, spent))
+    return history
+
+
+def brand_spend_history(brand_ids, granularity='day', start=None, end=None):
+    """
+    Spend per day or month of each brand, from the `BrandDailySpend` rollup.
+
+    One indexed range scan for all brands, whatever their number of ads.
+    Returns `{brand_id: [(period, spent)]}` in period order, where `period` is
+    a date (the first of the month for 'month') and only periods with spend
+    are listed. `start`/`end` bound the dates, both inclusive.
+    """
+    return _group_by_brand(brand_ids, spend_history_rows(brand_ids, granularity, start, end))
+
+
+async def abrand_spend_history(brand_ids, granularity='day', start=None, end=None):
+    """Async version of `brand_spend_history`."""
+    rows = spend_history_rows(brand_ids, granularity, start, end)
+    return _group_by_brand(brand_ids, [row async for row in rows])
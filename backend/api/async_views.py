@@ -0,0 +1,200 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .analytics import abrand_spend_history
+from .columnar import field_plan
+from .events import get_event_log
+from .fieldsets import SparseFieldsMixin
+from .models import Brand, Ad
+from .renderers import FastJSONRenderer
+from .serializers import AdSerializer, BrandSerializer, SpendQuerySerializer, BulkSpendQuerySerializer, EventQuerySerializer
+from .viewsets import BrandReadMixin
+
+
+# Seconds between comments on an idle event stream, so proxies keep it open.
+SSE_HEARTBEAT = 15.0
+
+
+def json_response(data, status=200):
+    # Same renderer as the DRF views, so both paths return the same bytes.
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncReadView(View):
+    """
+    Read-only endpoint awaiting Django's async ORM instead of holding a
+    worker thread for the whole query, for the ASGI server. Takes the same
+    querysets, serializers, pagination and query parameters as the matching
+    DRF viewset; serializers must not touch the database (no lazy relations).
+    """
+    http_method_names = ['get', 'head', 'options']
+    queryset = None
+    serializer_class = None
+
+    def setup(self, request, *args, **kwargs):
+        # A DRF request only for `query_params` and the pagination helpers;
+        # no parsing or authentication happens on these views.
+        super().setup(Request(request), *args, **kwargs)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except serializers.ValidationError as exc:
+            return json_response(exc.detail, status=400)
+        except Http404 as exc:
+            return json_response({'detail': str(exc) or 'Not found.'}, status=404)
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def validate_query(self, serializer_class, data=None):
+        query = serializer_class(data=self.request.query_params if data is None else data)
+        query.is_valid(raise_exception=True)
+        return query.validated_data
+
+    async def get_object(self):
+        queryset = self.get_queryset()
+        try:
+            return await queryset.aget(pk=self.kwargs['pk'])
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+class AsyncListView(AsyncReadView):
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        plan = None if queryset._prefetch_related_lookups else field_plan(self.get_serializer_class())
+        if plan is not None:
+            columns = list(plan.columns)
+            pk_name = queryset.model._meta.pk.attname
+            if pk_name not in columns:
+                # The pk orders pages even when it isn't asked for.
+                columns.append(pk_name)
+            queryset = queryset.values_list(*columns, named=True)
+        paginator = self.pagination_class() if self.pagination_class else None
+        page = await paginator.apaginate_queryset(queryset, self.request, view=self) if paginator else None
+        items = [obj async for obj in queryset] if page is None else page
+        data = self.get_serializer_class()(items, many=True).data if plan is None else plan.serialize(items)
+        return json_response(data if page is None else paginator.get_paginated_response(data).data)
+
+
+class AsyncDetailView(AsyncReadView):
+    async def get(self, request, *args, **kwargs):
+        return json_response(self.get_serializer_class()(await self.get_object()).data)
+
+
+class AsyncBrandList(BrandReadMixin, AsyncListView):
+    queryset = Brand.objects.all()
+    serializer_class = BrandSerializer
+
+
+class AsyncBrandDetail(BrandReadMixin, AsyncDetailView):
+    queryset = Brand.objects.all()
+    serializer_class = BrandSerializer
+
+
+class AsyncBrandSpend(BrandReadMixin, AsyncReadView):
+    queryset = Brand.objects.all()
+
+    async def spend_history(self, brand_ids, query):
+        granularity = query['granularity']
+        history = await abrand_spend_history(brand_ids, granularity, query.get('from'), query.get('to'))
+        return self.serialize_spend_history(history, granularity)
+
+    async def get(self, request, *args, **kwargs):
+        query = self.validate_query(SpendQuerySerializer)
+        brand = await self.get_object()
+        return json_response((await self.spend_history([brand.pk], query))[0])
+
+
+class AsyncBulkBrandSpend(AsyncBrandSpend):
+    async def get(self, request, *args, **kwargs):
+        query = self.validate_query(BulkSpendQuerySerializer)
+        brand_ids = [
+            pk async for pk in
+            Brand.objects.filter(pk__in=query['brand']).order_by('pk').values_list('pk', flat=True)
+        ]
+        return json_response(await self.spend_history(brand_ids, query))
+
+
+class AsyncAdList(SparseFieldsMixin, AsyncListView):
+    queryset = Ad.objects.all()
+    serializer_class = AdSerializer
+
+
+class AsyncAdDetail(SparseFieldsMixin, AsyncDetailView):
+    queryset = Ad.objects.all()
+    serializer_class = AdSerializer
+
+
+class EventsView(AsyncReadView):
+    """
+    Change feed of ad activations, deactivations and exhausted budgets.
+
+    `?after=<id>` returns up to `limit` events newer than that id, waiting up
+    to `wait` seconds for one to arrive; without `after` the feed starts at
+    its newest event. Clients pass the returned `cursor` as the next `after`.
+    `truncated` means events after `after` were dropped from the bounded log
+    and the client should reload the full state. With `Accept:
+    text/event-stream` the events are pushed as Server-Sent Events instead,
+    resuming from `Last-Event-ID`, by the ASGI server only: the WSGI one
+    would buffer the endless stream, so it answers 406 and clients poll.
+    Waiting holds no thread under ASGI only.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        log = get_event_log()
+        if log is None:
+            return json_response({'detail': 'The event log is disabled.'}, status=404)
+
+        data = self.request.query_params.copy()
+        if 'Last-Event-ID' in self.request.headers:
+            data['after'] = self.request.headers['Last-Event-ID']
+        query = self.validate_query(EventQuerySerializer, data)
+        after = query.get('after') or await sync_to_async(log.latest_id)()
+
+        if 'text/event-stream' in self.request.headers.get('Accept', ''):
+            if not isinstance(request, ASGIRequest):
+                return json_response(
+                    {'detail': 'Event streams are only served by the ASGI server; poll with `after` instead.'},
+                    status=406,
+                )
+            response = StreamingHttpResponse(self.stream(log, after, query['limit']), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        events, truncated = await log.aread(after, query['limit'], query['wait'])
+        if events:
+            cursor = events[-1][0]
+        else:
+            # Nothing left to deliver from a truncated position: continue at the end.
+            cursor = await sync_to_async(log.latest_id)() if truncated else after
+        return json_response({
+            'events': [{'id': event_id, **event} for event_id, event in events],
+            'cursor': cursor,
+            'truncated': truncated,
+        })
+
+    async def stream(self, log, after, limit):
+        renderer = FastJSONRenderer()
+        while True:
+            events, truncated = await log.aread(after, limit, SSE_HEARTBEAT)
+            if truncated:
+                yield 'event: truncated\ndata: {}\n\n'
+                if not events:
+                    after = await sync_to_async(log.latest_id)()
+            for event_id, event in events:
+                yield f'id: {event_id}\nevent: {event["type"]}\ndata: {renderer.render(event).decode()}\n\n'
+                after = event_id
+            if not events and not truncated:
+                yield ': heartbeat\n\n'
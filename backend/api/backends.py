@@ -0,0 +1,19 @@
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@lru_cache
+def _instantiate(backend):
+    return import_string(backend)()
+
+
+def load_backend(setting):
+    """
+    Instance of the class whose dotted path is in the `setting` setting, or
+    None when it is empty. One instance is kept per path.
+    """
+    backend = getattr(settings, setting)
+    if not backend:
+        return None
+    return _instantiate(backend)
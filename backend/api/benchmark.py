@@ -0,0 +1,151 @@
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from datetime import time as day_time
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+from .accrual import accrue_ad_spend
+from .metrics import count_queries
+from .models import Ad, AdSpend, Brand
+from .rollup import rebuild_brand_daily_spend, rollup_brand_spend
+from .scheduler import schedule_ads
+from .utils import chunks
+
+BATCH_SIZE = 5000
+
+
+def seed_dataset(brands=100, ads_per_brand=10, days=31, end=None, seed=0):
+    """
+    Bulk-create a synthetic catalog: brands, their ads, one AdSpend row
+    per ad per day for the `days` days up to `end` (today by default) and
+    the matching BrandDailySpend rollup.
+
+    Rows are generated lazily and written in batches so memory stays flat
+    at any scale. Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    end = end or timezone.now().date()
+    first_day = end - timedelta(days=days - 1)
+    tz = timezone.get_current_timezone()
+
+    with transaction.atomic():
+        brand_objs = Brand.objects.bulk_create(
+            (
+                Brand(
+                    name=f"Brand {idx}",
+                    daily_budget=Decimal(rng.randint(50, 500)),
+                    monthly_budget=Decimal(rng.randint(1000, 10000)),
+                )
+                for idx in range(brands)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+        ad_ids = []
+        for chunk in chunks((
+            Ad(
+                brand=brand,
+                name=f"{brand.name} Ad {idx}",
+                active=rng.random() < 0.5,
+                start_time=datetime.combine(first_day, day_time(rng.randint(0, 23)), tzinfo=tz),
+                end_time=datetime.combine(end + timedelta(days=rng.randint(0, 30)), day_time(rng.randint(0, 23)), tzinfo=tz),
+            )
+            for brand in brand_objs
+            for idx in range(ads_per_brand)
+        ), BATCH_SIZE):
+            ad_ids.extend(ad.pk for ad in Ad.objects.bulk_create(chunk))
+
+        spend_count = 0
+        for chunk in chunks((
+            AdSpend(ad_id=ad_id, date=first_day + timedelta(days=day), spent=rng.randint(0, 24))
+            for ad_id in ad_ids
+            for day in range(days)
+        ), BATCH_SIZE):
+            AdSpend.objects.bulk_create(chunk)
+            spend_count += len(chunk)
+
+        # bulk_create skips AdSpend.save(), so build the daily rollup in one go.
+        rollup_rows = rebuild_brand_daily_spend(Brand.objects.filter(pk__in=[brand.pk for brand in brand_objs]))
+
+    return {'brands': len(brand_objs), 'ads': len(ad_ids), 'adspend': spend_count, 'brand_daily_spend': rollup_rows}
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    runs: int
+    best: float
+    mean: float
+    queries: int
+    peak_kib: int
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def measure(name, func, repeat=3):
+    """
+    Time `func` `repeat` times, then run it once more under query counting
+    and tracemalloc, which would skew the timings, for its query count and
+    peak Python memory.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        with count_queries() as queries:
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name, repeat, min(timings), sum(timings) / repeat, queries[0], peak // 1024)
+
+
+def _api_client():
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    return Client(HTTP_HOST=host)
+
+
+def _get(client, url):
+    def request():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+    return request
+
+
+def benchmark_scenarios(now=None):
+    """`{name: callable}` of the hot paths: each periodic task and the main API reads."""
+    now = now or timezone.now()
+    client = _api_client()
+    brand_ids = list(Brand.objects.order_by('pk').values_list('pk', flat=True)[:100])
+    brand_query = '&'.join(f'brand={brand_id}' for brand_id in brand_ids)
+    first = brand_ids[0] if brand_ids else 0
+
+    return {
+        'task.scheduler': lambda: schedule_ads(now),
+        'task.accrual.recompute': lambda: accrue_ad_spend(now, mode='recompute'),
+        'task.accrual.incremental': lambda: accrue_ad_spend(now, mode='incremental'),
+        'task.rollup': lambda: rollup_brand_spend(now),
+        'api.brands': _get(client, '/api/brands/'),
+        'api.brands.expand_ads': _get(client, '/api/brands/?expand=ads&ads_limit=10'),
+        'api.ads': _get(client, '/api/ads/'),
+        'api.brand_spend': _get(client, f'/api/brands/{first}/spend/?granularity=month'),
+        'api.bulk_spend': _get(client, f'/api/brands/spend/?{brand_query}'),
+        'api.brand_budget': _get(client, f'/api/brands/budget/?{brand_query}'),
+        'api.export.brand_spend': _get(client, '/api/exports/brand-spend/'),
+    }
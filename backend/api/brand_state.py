@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from .models import Brand
+
+ZERO = Decimal('0.00')
+FIELDS = ('daily_budget', 'monthly_budget', 'daily_spend', 'monthly_spend')
+
+
+@dataclass(frozen=True)
+class BrandState:
+    brand: int
+    daily_budget: Decimal
+    monthly_budget: Decimal
+    daily_spend: Decimal
+    monthly_spend: Decimal
+
+    @property
+    def has_budget(self):
+        # Same rule as the scheduler's brand_has_budget().
+        return self.monthly_budget > self.monthly_spend and self.daily_budget > self.daily_spend
+
+    def as_dict(self):
+        return {**asdict(self), 'has_budget': self.has_budget}
+
+
+class LocalLRU:
+    """Small in-process LRU whose entries expire after `ttl` seconds."""
+
+    def __init__(self, size, ttl):
+        self.size, self.ttl = size, ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_states = LocalLRU(settings.BRAND_STATE_LOCAL_SIZE, settings.BRAND_STATE_LOCAL_TTL)
+
+
+def _key(brand_id):
+    return f'brand-state:{brand_id}'
+
+
+def get_brand_states(brand_ids):
+    """
+    Budget state of each brand: `{brand_id: BrandState}`, unknown brands left out.
+
+    Looked up in this process first, then in the shared Django cache, and
+    only brands found in neither are read from the database, in one query.
+    """
+    states, missing = {}, []
+    for brand_id in brand_ids:
+        state = local_states.get(brand_id)
+        if state is None:
+            missing.append(brand_id)
+        else:
+            states[brand_id] = state
+    if not missing:
+        return states
+
+    shared = cache.get_many([_key(brand_id) for brand_id in missing])
+    loaded = {}
+    for brand_id in missing:
+        state = shared.get(_key(brand_id))
+        if state is not None:
+            loaded[brand_id] = state
+
+    unknown = [brand_id for brand_id in missing if brand_id not in loaded]
+    if unknown:
+        fetched = {}
+        for brand_id, *values in Brand.objects.filter(pk__in=unknown).values_list('id', *FIELDS):
+            fetched[brand_id] = BrandState(brand_id, *(value or ZERO for value in values))
+        cache.set_many({_key(brand_id): state for brand_id, state in fetched.items()}, settings.BRAND_STATE_CACHE_TTL)
+        loaded.update(fetched)
+
+    for brand_id, state in loaded.items():
+        local_states.set(brand_id, state)
+    states.update(loaded)
+    return states
+
+
+def get_brand_state(brand_id):
+    return get_brand_states([brand_id]).get(brand_id)
+
+
+def invalidate_brand_states(brand_ids):
+    """
+    Drop brands from both cache layers. Call after the change committed, so
+    no reader caches the old row again; other processes may serve their
+    local copy for up to `BRAND_STATE_LOCAL_TTL` seconds.
+    """
+    brand_ids = list(brand_ids)
+    for brand_id in brand_ids:
+        local_states.discard(brand_id)
+    cache.delete_many([_key(brand_id) for brand_id in brand_ids])
@@ -0,0 +1,266 @@
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .backends import load_backend
+from .brand_state import invalidate_brand_states
+from .models import Brand
+
+ZERO = Decimal('0.00')
+DAY_TTL = 2 * 24 * 3600
+MONTH_TTL = 32 * 24 * 3600
+
+# KEYS: day spend hash, month spend hash, day exhausted set, month exhausted set
+# ARGV: day ttl, month ttl, then (brand_id, delta, daily_budget, monthly_budget) groups
+ADD_SPEND_SCRIPT = """
+local newly = {}
+for i = 3, #ARGV, 4 do
+    local brand = ARGV[i]
+    local daily = tonumber(redis.call('HINCRBYFLOAT', KEYS[1], brand, ARGV[i + 1]))
+    local monthly = tonumber(redis.call('HINCRBYFLOAT', KEYS[2], brand, ARGV[i + 1]))
+    local added = 0
+    if daily >= tonumber(ARGV[i + 2]) then
+        added = added + redis.call('SADD', KEYS[3], brand)
+    end
+    if monthly >= tonumber(ARGV[i + 3]) then
+        added = added + redis.call('SADD', KEYS[4], brand)
+    end
+    if added > 0 then
+        table.insert(newly, brand)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[4], ARGV[2])
+return newly
+"""
+
+# KEYS: same as ADD_SPEND_SCRIPT; ARGV: brand_id, daily_budget, monthly_budget
+RECHECK_SCRIPT = """
+local daily = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local monthly = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+if daily >= tonumber(ARGV[2]) then
+    redis.call('SADD', KEYS[3], ARGV[1])
+else
+    redis.call('SREM', KEYS[3], ARGV[1])
+end
+if monthly >= tonumber(ARGV[3]) then
+    redis.call('SADD', KEYS[4], ARGV[1])
+else
+    redis.call('SREM', KEYS[4], ARGV[1])
+end
+return 1
+"""
+
+
+class BudgetCounters:
+    """
+    Live per-brand daily/monthly spend, kept outside the database.
+
+    `add_spend` takes `{(brand_id, date): (delta, daily_budget, monthly_budget)}`
+    and returns the ids of brands whose budget it just exhausted.
+    """
+
+    def add_spend(self, spends):
+        raise NotImplementedError
+
+    def exhausted_brand_ids(self, day):
+        raise NotImplementedError
+
+    def spend_totals(self, day):
+        """Return `{brand_id: (daily, monthly)}` for `day` and its month."""
+        raise NotImplementedError
+
+    def recheck(self, brand_id, daily_budget, monthly_budget, day):
+        """Re-evaluate one brand after its budgets changed."""
+        raise NotImplementedError
+
+    def is_primed(self, day):
+        raise NotImplementedError
+
+    def prime(self, totals, budgets, day):
+        """Load `{brand_id: (daily, monthly)}` from the database for `day`."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _group_by_day(spends):
+        by_day = defaultdict(list)
+        for (brand_id, day), (delta, daily_budget, monthly_budget) in spends.items():
+            if delta:
+                by_day[day].append((brand_id, delta, daily_budget, monthly_budget))
+        return by_day
+
+
+class InMemoryBudgetCounters(BudgetCounters):
+    """Process-local counters with the same semantics, for tests and single-process setups."""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._spend = defaultdict(lambda: defaultdict(Decimal))
+        self._exhausted = defaultdict(set)
+        self._primed = set()
+
+    def add_spend(self, spends):
+        newly = set()
+        with self._lock:
+            for day, rows in self._group_by_day(spends).items():
+                for brand_id, delta, daily_budget, monthly_budget in rows:
+                    daily = self._spend[day][brand_id] = self._spend[day][brand_id] + delta
+                    month = day.strftime('%Y-%m')
+                    monthly = self._spend[month][brand_id] = self._spend[month][brand_id] + delta
+                    for key, spent, budget in ((day, daily, daily_budget), (month, monthly, monthly_budget)):
+                        if spent >= budget and brand_id not in self._exhausted[key]:
+                            self._exhausted[key].add(brand_id)
+                            newly.add(brand_id)
+        return newly
+
+    def exhausted_brand_ids(self, day):
+        with self._lock:
+            return self._exhausted[day] | self._exhausted[day.strftime('%Y-%m')]
+
+    def spend_totals(self, day):
+        with self._lock:
+            daily, monthly = self._spend[day], self._spend[day.strftime('%Y-%m')]
+            return {brand_id: (daily.get(brand_id, ZERO), monthly.get(brand_id, ZERO)) for brand_id in daily.keys() | monthly.keys()}
+
+    def recheck(self, brand_id, daily_budget, monthly_budget, day):
+        with self._lock:
+            for key, budget in ((day, daily_budget), (day.strftime('%Y-%m'), monthly_budget)):
+                if self._spend[key].get(brand_id, ZERO) >= budget:
+                    self._exhausted[key].add(brand_id)
+                else:
+                    self._exhausted[key].discard(brand_id)
+
+    def is_primed(self, day):
+        return day in self._primed
+
+    def prime(self, totals, budgets, day):
+        with self._lock:
+            month = day.strftime('%Y-%m')
+            for brand_id, (daily, monthly) in totals.items():
+                self._spend[day][brand_id] = daily
+                self._spend[month][brand_id] = monthly
+            self._primed.add(day)
+        for brand_id, (daily_budget, monthly_budget) in budgets.items():
+            self.recheck(brand_id, daily_budget, monthly_budget, day)
+
+
+class RedisBudgetCounters(BudgetCounters):
+    """Counters in Redis hashes, updated atomically by Lua scripts: one round trip per day of spend."""
+
+    def __init__(self, url=None, prefix='budget', **options):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.BUDGET_COUNTER_URL)
+        self.prefix = prefix
+        self._add_spend = self.client.register_script(ADD_SPEND_SCRIPT)
+        self._recheck = self.client.register_script(RECHECK_SCRIPT)
+
+    def _keys(self, day):
+        month = day.strftime('%Y-%m')
+        return [
+            f'{self.prefix}:spend:{day.isoformat()}',
+            f'{self.prefix}:spend:{month}',
+            f'{self.prefix}:exhausted:{day.isoformat()}',
+            f'{self.prefix}:exhausted:{month}',
+        ]
+
+    def add_spend(self, spends):
+        newly = set()
+        for day, rows in self._group_by_day(spends).items():
+            args = [DAY_TTL, MONTH_TTL]
+            for brand_id, delta, daily_budget, monthly_budget in rows:
+                args.extend((brand_id, str(delta), str(daily_budget), str(monthly_budget)))
+            newly.update(int(brand_id) for brand_id in self._add_spend(keys=self._keys(day), args=args))
+        return newly
+
+    def exhausted_brand_ids(self, day):
+        keys = self._keys(day)
+        return {int(brand_id) for brand_id in self.client.sunion(keys[2], keys[3])}
+
+    def spend_totals(self, day):
+        keys = self._keys(day)
+        with self.client.pipeline() as pipe:
+            pipe.hgetall(keys[0])
+            pipe.hgetall(keys[1])
+            daily, monthly = pipe.execute()
+        return {
+            int(brand_id): (Decimal(daily.get(brand_id, b'0').decode()), Decimal(monthly.get(brand_id, b'0').decode()))
+            for brand_id in daily.keys() | monthly.keys()
+        }
+
+    def recheck(self, brand_id, daily_budget, monthly_budget, day):
+        self._recheck(keys=self._keys(day), args=[brand_id, str(daily_budget), str(monthly_budget)])
+
+    def is_primed(self, day):
+        return bool(self.client.exists(f'{self.prefix}:primed:{day.isoformat()}'))
+
+    def prime(self, totals, budgets, day):
+        keys = self._keys(day)
+        with self.client.pipeline() as pipe:
+            for brand_id, (daily, monthly) in totals.items():
+                pipe.hset(keys[0], brand_id, str(daily))
+                pipe.hset(keys[1], brand_id, str(monthly))
+            for brand_id, (daily_budget, monthly_budget) in budgets.items():
+                daily, monthly = totals.get(brand_id, (ZERO, ZERO))
+                if daily >= daily_budget:
+                    pipe.sadd(keys[2], brand_id)
+                if monthly >= monthly_budget:
+                    pipe.sadd(keys[3], brand_id)
+            for key, ttl in zip(keys, (DAY_TTL, MONTH_TTL, DAY_TTL, MONTH_TTL)):
+                pipe.expire(key, ttl)
+            pipe.set(f'{self.prefix}:primed:{day.isoformat()}', 1, ex=DAY_TTL)
+            pipe.execute()
+
+
+def get_budget_counters():
+    """The configured `BudgetCounters`, or None when `BUDGET_COUNTER_BACKEND` is empty."""
+    return load_backend('BUDGET_COUNTER_BACKEND')
+
+
+def sync_budget_counters(now=None):
+    """
+    Keep the counters and `Brand.daily_spend`/`monthly_spend` in step.
+
+    The first run of a day primes the counters from the `BrandDailySpend`
+    rollup; later runs flush the counters into `Brand`, writing only brands
+    whose spend changed. Returns the number of brands written.
+    """
+    # The rollup imports the scheduler, which imports this module.
+    from .rollup import BATCH_SIZE, brand_spend_totals
+
+    counters = get_budget_counters()
+    if counters is None:
+        return 0
+
+    now = now or timezone.now()
+    today = now.date()
+    if not counters.is_primed(today):
+        budgets = {
+            brand_id: (daily_budget, monthly_budget)
+            for brand_id, daily_budget, monthly_budget in Brand.objects.values_list('id', 'daily_budget', 'monthly_budget')
+        }
+        counters.prime(brand_spend_totals(now), budgets, today)
+        return 0
+
+    totals = counters.spend_totals(today)
+    changed = []
+    for brand in Brand.objects.filter(pk__in=totals).only('id', 'daily_spend', 'monthly_spend'):
+        daily, monthly = totals[brand.pk]
+        if brand.daily_spend != daily or brand.monthly_spend != monthly:
+            brand.daily_spend, brand.monthly_spend = daily, monthly
+            brand.version, brand.last_modified = F('version') + 1, now
+            changed.append(brand)
+    Brand.objects.bulk_update(
+        changed, ['daily_spend', 'monthly_spend', 'version', 'last_modified'], batch_size=BATCH_SIZE
+    )
+    if changed:
+        transaction.on_commit(lambda: invalidate_brand_states(brand.pk for brand in changed))
+    return len(changed)
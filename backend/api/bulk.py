@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Ad, Brand, BrandDailySpend
+from .scheduler import schedule_ads
+from .serializers import AdSerializer, BulkAdSerializer, BulkAdUpdateSerializer, BulkAdRequestSerializer
+
+BATCH_SIZE = 1000
+
+
+def _validate_items(serializer, count):
+    if serializer.is_valid():
+        return [{} for _ in range(count)]
+    return [dict(errors) for errors in serializer.errors]
+
+
+def bulk_write_ads(data, now=None):
+    """
+    Create, partially update, pause and resume many ads in one transaction.
+
+    `data` is `{'create': [ad], 'update': [{'id', ...}], 'pause': [id], 'resume': [id]}`.
+    Every item is validated before anything is written; if any is invalid a
+    ValidationError carries per-item errors aligned with the input lists.
+    Paused and resumed ads are rescheduled at once. Returns the serialized
+    ads of each operation, in input order.
+    """
+    now = now or timezone.now()
+    request = BulkAdRequestSerializer(data=data)
+    request.is_valid(raise_exception=True)
+    operations = request.validated_data
+
+    creates = BulkAdSerializer(data=operations['create'], many=True)
+    updates = BulkAdUpdateSerializer(data=operations['update'], many=True, partial=True)
+    errors = {
+        'create': _validate_items(creates, len(operations['create'])),
+        'update': _validate_items(updates, len(operations['update'])),
+        'pause': [{} for _ in operations['pause']],
+        'resume': [{} for _ in operations['resume']],
+    }
+    valid_creates = [item for item, error in zip(creates.initial_data, errors['create']) if not error]
+    valid_updates = [item for item, error in zip(updates.initial_data, errors['update']) if not error]
+
+    # Brands and ads referenced anywhere in the request, fetched once each.
+    brand_ids = {int(item['brand']) for item in valid_creates + valid_updates if 'brand' in item}
+    known_brands = set(Brand.objects.filter(pk__in=brand_ids).values_list('pk', flat=True))
+    ad_ids = {int(item['id']) for item in valid_updates} | set(operations['pause']) | set(operations['resume'])
+    ads = Ad.objects.in_bulk(ad_ids)
+
+    for op, items in (('create', creates.initial_data), ('update', updates.initial_data)):
+        for item, error in zip(items, errors[op]):
+            if not error and 'brand' in item and int(item['brand']) not in known_brands:
+                error['brand'] = [f'Invalid pk "{item["brand"]}" - object does not exist.']
+            if not error and op == 'update' and int(item['id']) not in ads:
+                error['id'] = ['Ad not found.']
+    for op in ('pause', 'resume'):
+        for ad_id, error in zip(operations[op], errors[op]):
+            if ad_id not in ads:
+                error['id'] = ['Ad not found.']
+
+    if any(error for op_errors in errors.values() for error in op_errors):
+        raise serializers.ValidationError(errors)
+
+    # Brands whose ads change, including the brands ads are moved away from.
+    brand_ids = (
+        {attrs['brand_id'] for attrs in creates.validated_data + updates.validated_data if 'brand_id' in attrs}
+        | {ads[attrs['id']].brand_id for attrs in updates.validated_data}
+        | {ads[ad_id].brand_id for ad_id in operations['pause'] + operations['resume']}
+    )
+
+    with transaction.atomic():
+        Brand.bump_versions(brand_ids, now)
+        created = Ad.objects.bulk_create((Ad(**attrs) for attrs in creates.validated_data), batch_size=BATCH_SIZE)
+
+        updated, fields, moves = [], set(), {}
+        for attrs in updates.validated_data:
+            ad = ads[attrs.pop('id')]
+            if attrs.get('brand_id', ad.brand_id) != ad.brand_id:
+                moves[ad.pk] = (ad.brand_id, attrs['brand_id'])
+            for field, value in attrs.items():
+                setattr(ad, field, value)
+            fields.update(attrs)
+            updated.append(ad)
+        if fields:
+            Ad.objects.bulk_update(updated, fields, batch_size=BATCH_SIZE)
+        if moves:
+            # bulk_update sends no post_save: move re-branded ads' spend as the signal would.
+            BrandDailySpend.move_ad_spend(moves)
+
+        toggled = operations['pause'] + operations['resume']
+        if toggled:
+            Ad.objects.filter(pk__in=operations['pause']).update(paused=True)
+            Ad.objects.filter(pk__in=operations['resume']).update(paused=False)
+            schedule_ads(now, Ad.objects.filter(pk__in=toggled))
+
+        touched = [ad.pk for ad in created] + [ad.pk for ad in updated] + toggled
+        if settings.AD_TIMELINE_ENABLED:
+            # Bulk writes send no post_save, so replan here what the signal would have.
+            from .timeline import replan_ads
+            transaction.on_commit(lambda: replan_ads(touched, now))
+
+    ads = Ad.objects.in_bulk(touched)
+    return {
+        'create': AdSerializer([ads[ad.pk] for ad in created], many=True).data,
+        'update': AdSerializer([ads[ad.pk] for ad in updated], many=True).data,
+        'pause': AdSerializer([ads[ad_id] for ad_id in operations['pause']], many=True).data,
+        'resume': AdSerializer([ads[ad_id] for ad_id in operations['resume']], many=True).data,
+    }
@@ -0,0 +1,121 @@
+import datetime
+from dataclasses import dataclass
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import relations, serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+# Fields whose representation of a value read from its model column is the value itself.
+PASSTHROUGH = {
+    serializers.IntegerField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.BooleanField.to_representation,
+}
+
+
+def _decimal(field):
+    represent = field.to_representation
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.decimal_places is None or field.normalize_output or field.localize or not coerce_to_string:
+        return represent
+    exponent = -field.decimal_places
+
+    def convert(value):
+        # Columns already hold the field's places, quantizing would not change them.
+        if value.as_tuple().exponent == exponent:
+            return f'{value:f}'
+        return represent(value)
+    return convert
+
+
+def _datetime(field):
+    represent = field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if not isinstance(output_format, str) or output_format.lower() != ISO_8601:
+        return represent
+    if field_timezone is not datetime.timezone.utc and getattr(field_timezone, 'key', None) != 'UTC':
+        return represent
+
+    def convert(value):
+        # Aware UTC values, which is what the database returns, need no conversion.
+        if value.tzinfo is not datetime.timezone.utc:
+            return represent(value)
+        return value.isoformat()[:-6] + 'Z'
+    return convert
+
+
+def _converter(field):
+    if isinstance(field, serializers.DecimalField):
+        return _decimal(field)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime(field)
+    return field.to_representation
+
+
+@dataclass(frozen=True)
+class FieldPlan:
+    """
+    What a flat `ModelSerializer` outputs, worked out once: the columns to
+    read with `values_list` and, for each output key, whether the column
+    value needs converting. `serialize` then builds the same dicts as the
+    serializer from row tuples, without model instances or per-row field
+    traversal.
+    """
+    keys: tuple
+    columns: tuple
+    fields: tuple
+    # Indexes of the columns whose value is not already its representation.
+    converted: tuple
+
+    def serialize(self, rows):
+        """Serializer output for `rows`, tuples starting with `columns`; any further values are ignored."""
+        keys = self.keys
+        # Bound per call: the datetime conversion depends on the active timezone.
+        converters = [(idx, keys[idx], _converter(self.fields[idx])) for idx in self.converted]
+        data = []
+        for row in rows:
+            item = dict(zip(keys, row))
+            for idx, key, convert in converters:
+                value = row[idx]
+                if value is not None:
+                    item[key] = convert(value)
+            data.append(item)
+        return data
+
+
+@lru_cache
+def field_plan(serializer_class):
+    """
+    The `FieldPlan` of `serializer_class`, or None when it has anything a
+    plan can't reproduce: nested serializers, method or dotted-source
+    fields, non-pk relations or a custom `to_representation`.
+    """
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    if serializer_class.to_representation is not serializers.Serializer.to_representation:
+        return None
+
+    serializer = serializer_class()
+    opts = serializer.Meta.model._meta
+    keys, columns, fields, converted = [], [], [], []
+    for field in serializer._readable_fields:
+        if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField, relations.ManyRelatedField)):
+            return None
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+
+        if isinstance(field, relations.RelatedField):
+            # The column holds the related pk, which is what the field outputs.
+            if not isinstance(field, relations.PrimaryKeyRelatedField) or field.pk_field is not None:
+                return None
+        elif type(field).to_representation not in PASSTHROUGH:
+            converted.append(len(keys))
+        keys.append(field.field_name)
+        columns.append(field.source)
+        fields.append(field)
+    return FieldPlan(tuple(keys), tuple(columns), tuple(fields), tuple(converted))
@@ -0,0 +1,113 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .columnar import field_plan
+
+
+class ConditionalReadMixin:
+    """
+    `list` and `retrieve` that answer conditional GETs from brand version stamps.
+
+    The ETag of a response hashes the id and brand version of every item on
+    it, read with the page itself, and the query parameters that shape them, so an unchanged `If-None-Match` gets a 304
+    before any prefetch or serialization. Details also carry Last-Modified;
+    lists don't, as a deleted item would not make any remaining one newer.
+    With `RESPONSE_CACHE_ENABLED` each item's serialized form is cached under
+    its brand version, so only items of changed brands are serialized again.
+
+    Lists whose serializer has a `FieldPlan` skip model instances and that
+    cache altogether: the page is read as `values_list` rows, together with
+    `version_columns` for `item_version`, and serialized from them.
+    """
+    # Query parameters that pick the page rather than how items serialize.
+    page_query_params = ('cursor', 'page_size')
+    # Row attributes `item_version` reads, fetched with a plan's columns.
+    version_columns = ()
+
+    def item_version(self, obj):
+        """`(version, last_modified)` of the brand `obj`'s representation derives from."""
+        raise NotImplementedError
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Prefetches wait until the versions show the body is needed at all.
+            self.deferred_prefetches = queryset._prefetch_related_lookups
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    def list_plan(self):
+        """The `FieldPlan` to serialize the list with, None to go through the serializer."""
+        if self.deferred_prefetches:
+            return None
+        return field_plan(self.get_serializer_class())
+
+    def variant(self):
+        """The query parameters that change how items serialize, such as `expand` or `fields`."""
+        return sorted(
+            (name, values) for name, values in self.request.query_params.lists()
+            if name not in self.page_query_params
+        )
+
+    def make_etag(self, *parts):
+        key = repr((self.request.accepted_renderer.format, self.variant(), parts)).encode()
+        return f'"{hashlib.md5(key, usedforsecurity=False).hexdigest()}"'
+
+    def conditional_response(self, etag, last_modified, render):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def cache_key(self, obj):
+        digest = hashlib.md5(repr(self.variant()).encode(), usedforsecurity=False).hexdigest()
+        return f'api:{self.basename}:{digest}:{obj.pk}:{self.item_version(obj)[0]}'
+
+    def serialize_items(self, items):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            prefetch_related_objects(items, *self.deferred_prefetches)
+            return list(self.get_serializer(items, many=True).data)
+
+        keys = {obj.pk: self.cache_key(obj) for obj in items}
+        cached = cache.get_many(list(keys.values()))
+        misses = [obj for obj in items if keys[obj.pk] not in cached]
+        if misses:
+            prefetch_related_objects(misses, *self.deferred_prefetches)
+            fresh = dict(zip((keys[obj.pk] for obj in misses), self.get_serializer(misses, many=True).data))
+            cache.set_many(fresh, settings.RESPONSE_CACHE_TTL)
+            cached.update(fresh)
+        return [cached[keys[obj.pk]] for obj in items]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        pk_name = queryset.model._meta.pk.attname
+        plan = self.list_plan()
+        if plan is not None:
+            # The pk orders pages and tags the ETag even when it isn't asked for.
+            extra = [name for name in (pk_name, *self.version_columns) if name not in plan.columns]
+            queryset = queryset.values_list(*plan.columns, *extra, named=True)
+        page = self.paginate_queryset(queryset)
+        items = list(queryset) if page is None else page
+        # The links change with the rows around the page, not only the rows on it.
+        links = (self.paginator.get_previous_link(), self.paginator.get_next_link()) if page is not None else ()
+        etag = self.make_etag(links, [(getattr(obj, pk_name), self.item_version(obj)[0]) for obj in items])
+
+        def render():
+            data = self.serialize_items(items) if plan is None else plan.serialize(items)
+            return Response(data) if page is None else self.get_paginated_response(data)
+
+        return self.conditional_response(etag, None, render)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        version, last_modified = self.item_version(instance)
+        etag = self.make_etag(instance.pk, version)
+        return self.conditional_response(etag, last_modified, lambda: Response(self.serialize_items([instance])[0]))
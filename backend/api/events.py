@@ -0,0 +1,169 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import deque
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from .backends import load_backend
+
+EVENT_TYPES = ('ad.activated', 'ad.deactivated', 'brand.budget_exhausted')
+# Event ids are Redis stream ids, `<milliseconds>-<sequence>`, in every backend.
+EVENT_ID_RE = re.compile(r'^\d+-\d+$')
+POLL_INTERVAL = 0.25
+
+
+def _parse_id(event_id):
+    ms, seq = event_id.split('-')
+    return int(ms), int(seq)
+
+
+class EventLog:
+    """
+    Bounded log of change events shared by every process. Readers keep the
+    id of the last event they saw and ask for what came after it; events
+    older than the last `EVENT_LOG_MAXLEN` are dropped.
+    """
+
+    def append(self, events):
+        """Append event dicts in order and return their ids."""
+        raise NotImplementedError
+
+    def latest_id(self):
+        """Id of the newest event, '0-0' while the log is empty."""
+        raise NotImplementedError
+
+    def read(self, after, limit):
+        """
+        Return `(events, truncated)`: up to `limit` `(id, event)` pairs newer
+        than id `after`, and whether events newer than it were already dropped.
+        """
+        raise NotImplementedError
+
+    async def aread(self, after, limit, timeout):
+        """`read`, waiting up to `timeout` seconds for an event to arrive."""
+        deadline = time.monotonic() + timeout
+        while True:
+            events, truncated = await sync_to_async(self.read)(after, limit)
+            remaining = deadline - time.monotonic()
+            if events or truncated or remaining <= 0:
+                return events, truncated
+            await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+
+class InMemoryEventLog(EventLog):
+    """Process-local log with the same semantics, for tests and single-process setups."""
+
+    def __init__(self, maxlen=None, **options):
+        self.maxlen = maxlen or settings.EVENT_LOG_MAXLEN
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._events = deque()
+        self._last = 0
+        self._dropped = 0
+
+    def append(self, events):
+        with self._lock:
+            ids = []
+            for event in events:
+                self._last += 1
+                self._events.append((self._last, event))
+                ids.append(f'{self._last}-0')
+            while len(self._events) > self.maxlen:
+                self._dropped = self._events.popleft()[0]
+            return ids
+
+    def latest_id(self):
+        with self._lock:
+            return f'{self._last}-0'
+
+    def read(self, after, limit):
+        after = _parse_id(after)
+        with self._lock:
+            events = [(f'{seq}-0', event) for seq, event in self._events if (seq, 0) > after]
+            return events[:limit], (self._dropped, 0) > after
+
+
+class RedisEventLog(EventLog):
+    """
+    One Redis stream capped with `XADD MAXLEN ~`. Waiting readers block in
+    `XREAD` on an asyncio connection instead of holding a thread.
+    """
+
+    def __init__(self, url=None, key='events', maxlen=None, **options):
+        import redis
+
+        self.url = url or settings.EVENT_LOG_URL
+        self.client = redis.Redis.from_url(self.url, decode_responses=True)
+        self.key = key
+        self.maxlen = maxlen or settings.EVENT_LOG_MAXLEN
+
+    def append(self, events):
+        with self.client.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(self.key, {'event': json.dumps(event, cls=DjangoJSONEncoder)}, maxlen=self.maxlen, approximate=True)
+            return pipe.execute()
+
+    def latest_id(self):
+        entries = self.client.xrevrange(self.key, count=1)
+        return entries[0][0] if entries else '0-0'
+
+    def _decode(self, entries):
+        return [(event_id, json.loads(fields['event'])) for event_id, fields in entries]
+
+    def _truncated(self, info, after):
+        # Redis 7 records the newest id trimming has removed.
+        return _parse_id(info.get('max-deleted-entry-id', '0-0')) > _parse_id(after)
+
+    def read(self, after, limit):
+        import redis
+
+        entries = self.client.xrange(self.key, min=f'({after}', count=limit)
+        try:
+            truncated = self._truncated(self.client.xinfo_stream(self.key), after)
+        except redis.ResponseError:
+            truncated = False
+        return self._decode(entries), truncated
+
+    async def aread(self, after, limit, timeout):
+        import redis
+        import redis.asyncio
+
+        # A connection per call: readers may run on different event loops.
+        async with redis.asyncio.Redis.from_url(self.url, decode_responses=True) as client:
+            try:
+                truncated = self._truncated(await client.xinfo_stream(self.key), after)
+            except redis.ResponseError:
+                truncated = False
+            block = max(int(timeout * 1000), 1) if timeout > 0 and not truncated else None
+            response = await client.xread({self.key: after}, count=limit, block=block)
+        entries = response[0][1] if response else []
+        return self._decode(entries), truncated
+
+
+def get_event_log():
+    """The configured `EventLog`, or None when `EVENT_LOG_BACKEND` is empty."""
+    return load_backend('EVENT_LOG_BACKEND')
+
+
+def publish(events):
+    """Append `events` to the log once the current transaction commits, so rolled back changes are never announced."""
+    log = get_event_log()
+    if log is not None and events:
+        transaction.on_commit(lambda: log.append(events))
+
+
+def ad_events(event_type, rows, now, reason):
+    return [
+        {'type': event_type, 'ad': ad_id, 'brand': brand_id, 'reason': reason, 'at': now.isoformat()}
+        for ad_id, brand_id in rows
+    ]
+
+
+def budget_exhausted_events(brand_ids, now):
+    return [{'type': 'brand.budget_exhausted', 'brand': brand_id, 'at': now.isoformat()} for brand_id in sorted(brand_ids)]
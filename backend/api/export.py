@@ -0,0 +1,63 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import AdSpend, BrandDailySpend
+
+EXPORT_OUTPUTS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+CHUNK_SIZE = 2000
+
+ADSPEND_COLUMNS = ('date', 'brand_id', 'brand_name', 'ad_id', 'ad_name', 'spent')
+BRAND_SPEND_COLUMNS = ('date', 'brand_id', 'brand_name', 'spent')
+
+
+def _filter(rows, start, end, brand_ids, brand_field):
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    if brand_ids:
+        rows = rows.filter(**{f'{brand_field}__in': brand_ids})
+    return rows
+
+
+def adspend_rows(start=None, end=None, brand_ids=None, chunk_size=CHUNK_SIZE):
+    """`ADSPEND_COLUMNS` tuples of every matching `AdSpend`, fetched `chunk_size` rows at a time."""
+    rows = _filter(AdSpend.objects.all(), start, end, brand_ids, 'ad__brand')
+    return (
+        rows.order_by('date', 'ad_id')
+        .values_list('date', 'ad__brand_id', 'ad__brand__name', 'ad_id', 'ad__name', 'spent')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def brand_spend_rows(start=None, end=None, brand_ids=None, chunk_size=CHUNK_SIZE):
+    """`BRAND_SPEND_COLUMNS` tuples from the daily rollup."""
+    rows = _filter(BrandDailySpend.objects.all(), start, end, brand_ids, 'brand')
+    return (
+        rows.order_by('date', 'brand_id')
+        .values_list('date', 'brand_id', 'brand__name', 'spent')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def render(output, columns, rows):
+    """Lazily encode `rows` as `output`, one line per row."""
+    return render_csv(columns, rows) if output == 'csv' else render_ndjson(columns, rows)
@@ -0,0 +1,132 @@
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def _column(model, source):
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if not field.concrete or field.many_to_many or field.primary_key:
+        return None
+    return field.name
+
+
+def _nested(field):
+    child = getattr(field, 'child', field)
+    return child if isinstance(child, serializers.BaseSerializer) else None
+
+
+@lru_cache
+def field_tree(serializer_class):
+    """
+    `{name: (column, nested)}` for each field `serializer_class` outputs:
+    the model column it reads (None for the pk and computed fields) and,
+    for nested serializers, their own tree.
+    """
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    tree = {}
+    for field in serializer._readable_fields:
+        child = _nested(field)
+        tree[field.field_name] = (
+            None if child else _column(model, field.source),
+            field_tree(type(child)) if child else None,
+        )
+    return tree
+
+
+def deferred_columns(serializer_class, fields, keep=()):
+    """Columns of the fields of `serializer_class` not in `fields`, except those in `keep`."""
+    return [
+        column for name, (column, _) in field_tree(serializer_class).items()
+        if column and name not in fields and column not in keep
+    ]
+
+
+@lru_cache(maxsize=256)
+def sparse_serializer(serializer_class, fields, nested=()):
+    """
+    Subclass of `serializer_class` outputting only `fields`, a frozenset or
+    None for all of them, and its nested serializers, narrowed the same way
+    by the `(name, fields)` pairs of `nested`. Cached, so each field set
+    gets one class and one `FieldPlan`.
+    """
+    nested = dict(nested)
+
+    class SparseSerializer(serializer_class):
+        def get_fields(self):
+            kept = {}
+            for name, field in super().get_fields().items():
+                child = _nested(field)
+                if child is None:
+                    if fields is None or name in fields:
+                        kept[name] = field
+                    continue
+                if name in nested:
+                    narrowed = sparse_serializer(type(child), nested[name])(*child._args, **child._kwargs)
+                    if child is field:
+                        field = narrowed
+                    else:
+                        field.child = narrowed
+                        narrowed.bind(field_name='', parent=field)
+                kept[name] = field
+            return kept
+
+    SparseSerializer.__name__ = SparseSerializer.__qualname__ = serializer_class.__name__
+    return SparseSerializer
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=id,active` on reads: items keep only those fields and the
+    columns of the others are not selected. `ads.id,ads.active` narrows the
+    ads embedded by `?expand=ads` the same way; embedded relations are asked
+    for with `expand` and stay whatever `fields` lists. Writes always take
+    and return every field.
+    """
+
+    def full_serializer_class(self):
+        return self.serializer_class
+
+    def sparse_fields(self):
+        """`{None: names, nested field: names}` asked for in `?fields=`, empty when it isn't given."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self.parse_fields()
+        return self._sparse_fields
+
+    def parse_fields(self):
+        value = self.request.query_params.get('fields', '')
+        if self.request.method not in ('GET', 'HEAD') or not value.strip():
+            return {}
+
+        tree = field_tree(self.full_serializer_class())
+        fields, errors = {}, []
+        for entry in filter(None, (entry.strip() for entry in value.split(','))):
+            name, _, nested_name = entry.partition('.')
+            _, nested = tree.get(name, (None, None))
+            if name not in tree or nested_name and (nested is None or nested_name not in nested):
+                errors.append(f"Unknown field '{entry}'.")
+            elif nested_name:
+                fields.setdefault(name, set()).add(nested_name)
+            else:
+                fields.setdefault(None, set()).add(name)
+        if errors:
+            raise serializers.ValidationError({'fields': errors})
+        return {name: frozenset(names) for name, names in fields.items()}
+
+    def get_serializer_class(self):
+        serializer_class = self.full_serializer_class()
+        fields = self.sparse_fields()
+        if not fields:
+            return serializer_class
+        nested = tuple(sorted((name, names) for name, names in fields.items() if name is not None))
+        return sparse_serializer(serializer_class, fields.get(None), nested)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.sparse_fields().get(None)
+        if fields:
+            queryset = queryset.defer(*deferred_columns(self.full_serializer_class(), fields))
+        return queryset
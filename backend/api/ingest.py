@@ -0,0 +1,144 @@
+import csv
+import json
+from collections import defaultdict
+from dataclasses import dataclass, asdict, field
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from .accrual import enforce_live_budgets
+from .budget import get_budget_counters
+from .models import Ad, AdSpend, Brand, BrandDailySpend
+from .rollup import rollup_brand_spend
+from .utils import chunks
+
+INGEST_INPUTS = ('csv', 'ndjson')
+CHUNK_SIZE = 5000
+MAX_ERRORS = 100
+MAX_SPENT = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+
+@dataclass
+class IngestResult:
+    rows: int = 0
+    written: int = 0
+    rejected: int = 0
+    brands: int = 0
+    budgets_exhausted: int = 0
+    ads_deactivated: int = 0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+
+def read_csv(lines):
+    """Yield `(line_number, record)` from CSV text with an `ad_id,date,spent` header."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_ndjson(lines):
+    """Yield `(line_number, record)` from one JSON object per line; malformed lines give None."""
+    for line_num, text in enumerate(lines, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        yield line_num, record if isinstance(record, dict) else None
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def parse_record(record):
+    """Return `(ad_id, date, spent)` or raise ValueError with a message fit for the report."""
+    if record is None:
+        raise ValueError("Not a JSON object.")
+    try:
+        ad_id = int(record['ad_id'])
+        day = date.fromisoformat(str(record['date']))
+        spent = Decimal(str(record['spent']))
+    except KeyError as exc:
+        raise ValueError(f"Missing {exc.args[0]}.")
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("ad_id must be an integer, date YYYY-MM-DD and spent a decimal.")
+    if ad_id < 1:
+        raise ValueError("ad_id must be positive.")
+    if not spent.is_finite() or not 0 <= spent <= MAX_SPENT or spent != spent.quantize(CENT):
+        raise ValueError(f"spent must be between 0 and {MAX_SPENT} with at most two decimals.")
+    return ad_id, day, spent
+
+
+def ingest_adspend(records, chunk_size=CHUNK_SIZE, now=None):
+    """
+    Upsert externally reported spend: `records` yields `(line_number, record)`.
+
+    Reported spend replaces what is stored for its (ad, date), and from then
+    on accrual leaves that day alone, even today for an active ad. Records are
+    validated and written a chunk at a time, each chunk in its own
+    transaction together with its `BrandDailySpend` deltas. Invalid
+    records are reported and skipped; within a chunk the last record of an
+    (ad, date) wins. Only the brands that received spend are rolled up.
+    """
+    now = now or timezone.now()
+    result = IngestResult()
+    deltas = defaultdict(Decimal)
+
+    for chunk in chunks(records, chunk_size):
+        parsed = {}
+        for line_num, record in chunk:
+            result.rows += 1
+            try:
+                ad_id, day, spent = parse_record(record)
+            except ValueError as exc:
+                result.reject(line_num, str(exc))
+                continue
+            parsed[(ad_id, day)] = (line_num, spent)
+
+        brand_of = dict(Ad.objects.filter(pk__in={ad_id for ad_id, _ in parsed}).values_list('pk', 'brand_id'))
+        rows = []
+        for (ad_id, day), (line_num, spent) in parsed.items():
+            if ad_id in brand_of:
+                rows.append((ad_id, day, spent))
+            else:
+                result.reject(line_num, f"Unknown ad {ad_id}.")
+        if not rows:
+            continue
+
+        with transaction.atomic():
+            existing = AdSpend.objects.select_for_update().filter(
+                ad_id__in={ad_id for ad_id, _, _ in rows}, date__in={day for _, day, _ in rows}
+            )
+            previous = {(ad_id, day): spent for ad_id, day, spent in existing.values_list('ad_id', 'date', 'spent')}
+
+            chunk_deltas = defaultdict(Decimal)
+            for ad_id, day, spent in rows:
+                chunk_deltas[(brand_of[ad_id], day)] += spent - previous.get((ad_id, day), 0)
+
+            AdSpend.upsert_spent(rows)
+            BrandDailySpend.apply_deltas(chunk_deltas)
+
+        result.written += len(rows)
+        for key, delta in chunk_deltas.items():
+            deltas[key] += delta
+
+    brand_ids = {brand_id for brand_id, _ in deltas}
+    result.brands = len(brand_ids)
+    if not brand_ids:
+        return result
+
+    counters = get_budget_counters()
+    if counters is not None:
+        enforce_live_budgets(counters, deltas, result, now)
+    result.ads_deactivated += rollup_brand_spend(now, Brand.objects.filter(pk__in=brand_ids)).ads_deactivated
+    return result
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import statistics
+import time
+from dataclasses import dataclass, asdict
+from urllib.parse import urlsplit
+
+
+@dataclass
+class LoadResult:
+    url: str
+    concurrency: int
+    requests: int
+    errors: int
+    elapsed: float
+    p50: float
+    p95: float
+    p99: float
+
+    @property
+    def throughput(self):
+        return (self.requests - self.errors) / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {**asdict(self), 'throughput': self.throughput}
+
+
+async def _get(host, port, path, timeout):
+    """One `GET` on a fresh connection; returns its status code, 0 when the request failed."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return 0
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Read to EOF so the whole response body counts in the latency.
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        return 0
+    finally:
+        writer.close()
+
+
+async def run_load(base_url, paths, requests=1000, concurrency=50, timeout=30.0):
+    """
+    Send `requests` GETs to `base_url`, cycling through `paths`, with at most
+    `concurrency` in flight. Any non-2xx response or failure counts as an
+    error; latencies (seconds) are over all requests.
+    """
+    url = urlsplit(base_url)
+    if url.scheme != 'http' or not url.hostname:
+        raise ValueError(f"Expected an http:// URL, got {base_url!r}.")
+    host, port = url.hostname, url.port or 80
+    targets = itertools.islice(itertools.cycle(paths), requests)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for path in targets:
+            started = time.perf_counter()
+            status = await _get(host, port, path, timeout)
+            latencies.append(time.perf_counter() - started)
+            if not 200 <= status < 300:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return LoadResult(base_url, concurrency, len(latencies), errors, elapsed, cuts[49], cuts[94], cuts[98])
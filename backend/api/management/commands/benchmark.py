@@ -0,0 +1,50 @@
+import json
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.benchmark import benchmark_scenarios, measure, seed_dataset
+from api.utils import rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog and report wall time, query count and peak memory of each task and "
+        "main API endpoint. Everything is rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=1000)
+        parser.add_argument('--ads-per-brand', type=int, default=10)
+        parser.add_argument('--days', type=int, default=31, help="AdSpend rows per ad.")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per scenario.")
+        parser.add_argument('--only', help="Regex: run only the scenarios it matches.")
+        parser.add_argument('--json', action='store_true', help="One JSON object per scenario instead of a table.")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data.")
+
+    def handle(self, *args, **options):
+        with rolled_back(not options['keep']):
+            self.run(options)
+
+    def run(self, options):
+        counts = seed_dataset(options['brands'], options['ads_per_brand'], options['days'])
+        if not options['json']:
+            self.stdout.write(f"{connection.vendor}: seeded {counts}")
+
+        scenarios = benchmark_scenarios()
+        if options['only']:
+            try:
+                pattern = re.compile(options['only'])
+            except re.error as exc:
+                raise CommandError(f"Invalid --only pattern: {exc}")
+            scenarios = {name: func for name, func in scenarios.items() if pattern.search(name)}
+
+        if not options['json']:
+            self.stdout.write(f"{'scenario':<28}{'best s':>10}{'mean s':>10}{'queries':>10}{'peak KiB':>12}")
+        for name, func in scenarios.items():
+            result = measure(name, func, options['repeat'])
+            if options['json']:
+                self.stdout.write(json.dumps({'vendor': connection.vendor, **counts, **result.as_dict()}))
+            else:
+                self.stdout.write(
+                    f"{name:<28}{result.best:>10.4f}{result.mean:>10.4f}{result.queries:>10}{result.peak_kib:>12}"
+                )
@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from api.models import Brand
+from api.serializers import BULK_MAX_ITEMS
+from api.utils import rolled_back
+from api.viewsets import AdViewSet
+
+
+class Command(BaseCommand):
+    help = "Compare creating ads one request at a time with the bulk endpoint. Nothing is kept."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        create = AdViewSet.as_view({'post': 'create'})
+        bulk = AdViewSet.as_view({'post': 'bulk'})
+
+        with rolled_back():
+            brand = Brand.objects.create(name="Benchmark", daily_budget=100, monthly_budget=1000)
+            start = timezone.now() + timedelta(days=1)
+            payloads = [
+                {'name': f"Ad {idx}", 'brand': brand.pk, 'start_time': start, 'end_time': start + timedelta(hours=8)}
+                for idx in range(options['ads'])
+            ]
+
+            def single():
+                for payload in payloads:
+                    yield create(factory.post('/api/ads/', payload, format='json'))
+
+            def batched():
+                for idx in range(0, len(payloads), BULK_MAX_ITEMS):
+                    yield bulk(factory.post('/api/ads/bulk/', {'create': payloads[idx:idx + BULK_MAX_ITEMS]}, format='json'))
+
+            self.measure("single", single)
+            self.measure("bulk", batched)
+
+    def measure(self, name, requests):
+        ads = 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for response in requests():
+                if response.status_code not in (200, 201):
+                    raise CommandError(f"{name} request failed with {response.status_code}: {response.data}")
+                ads += len(response.data['create']) if 'create' in response.data else 1
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{name}: {ads} ads in {elapsed:.3f}s ({ads / elapsed:.0f} ads/s), {len(queries)} queries"
+        )
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from api.benchmark import seed_dataset
+from api.columnar import field_plan
+from api.models import Ad, Brand
+from api.renderers import FastJSONRenderer
+from api.serializers import AdSerializer, BrandSerializer
+from api.utils import rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering brand and ad lists through their serializers with the columnar field plans, "
+        "query included, and check both give the same bytes. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=1000)
+        parser.add_argument('--ads-per-brand', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per path, the best is reported.")
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            seed_dataset(options['brands'], options['ads_per_brand'], days=1)
+            for name, model, serializer_class in (('ads', Ad, AdSerializer), ('brands', Brand, BrandSerializer)):
+                self.compare(name, model.objects.order_by('pk'), serializer_class, options['repeat'])
+
+    def compare(self, name, queryset, serializer_class, repeat):
+        plan = field_plan(serializer_class)
+
+        def serializer():
+            return JSONRenderer().render(serializer_class(list(queryset), many=True).data)
+
+        def columnar():
+            return FastJSONRenderer().render(plan.serialize(list(queryset.values_list(*plan.columns))))
+
+        outputs = {}
+        for path, render in (('serializer', serializer), ('columnar', columnar)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                outputs[path] = render()
+                timings.append(time.perf_counter() - started)
+            rows = queryset.count()
+            best = min(timings)
+            self.stdout.write(f"{name} {path}: {rows} rows in {best:.3f}s ({rows / best:.0f} rows/s)")
+
+        if outputs['serializer'] != outputs['columnar']:
+            raise CommandError(f"{name}: the columnar output differs from the serializer's")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Brand
+from api.rollup import find_brand_daily_spend_drift, rebuild_brand_daily_spend
+
+
+class Command(BaseCommand):
+    help = "Compare the BrandDailySpend rollup with AdSpend and report (or fix) drifted rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brand', type=int, action='append', dest='brands', help="Only check this brand (repeatable).")
+        parser.add_argument('--fix', action='store_true', help="Rebuild the rollup of every drifted brand.")
+
+    def handle(self, *args, **options):
+        brands = Brand.objects.filter(pk__in=options['brands']) if options['brands'] else None
+
+        drifted = set()
+        for brand_id, date, expected, stored in find_brand_daily_spend_drift(brands):
+            drifted.add(brand_id)
+            self.stdout.write(f"Brand {brand_id} on {date}: expected {expected}, stored {stored}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Brand daily spend is consistent with AdSpend."))
+            return
+
+        if not options['fix']:
+            raise CommandError(f"{len(drifted)} brands drifted from AdSpend, run with --fix to rebuild them.")
+
+        rows = rebuild_brand_daily_spend(Brand.objects.filter(pk__in=drifted))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rows for {len(drifted)} brands."))
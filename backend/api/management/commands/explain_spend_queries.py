@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from api.benchmark import seed_dataset
+from api.models import Ad, AdSpend, Brand
+from api.rollup import brand_spend_totals_query
+from api.scheduler import brand_has_budget, in_window
+from api.utils import rolled_back
+
+
+class Command(BaseCommand):
+    help = "Print query plans of the hot scheduler/accrual/rollup queries, with and without the spend indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Seed a synthetic dataset first (kept after the run).")
+        parser.add_argument('--brands', type=int, default=1000)
+        parser.add_argument('--ads-per-brand', type=int, default=10)
+        parser.add_argument('--days', type=int, default=31)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            counts = seed_dataset(options['brands'], options['ads_per_brand'], options['days'])
+            self.stdout.write(f"Seeded {counts}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Before (legacy query shapes, no spend indexes)"))
+        with rolled_back():
+            self.drop_spend_indexes()
+            self.explain(self.legacy_queries())
+
+        self.stdout.write(self.style.MIGRATE_HEADING("After (current query shapes and indexes)"))
+        self.explain(self.current_queries())
+
+    def drop_spend_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Ad, AdSpend):
+                table = connection.ops.quote_name(model._meta.db_table)
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+                # SQLite builds unique constraints into the table definition,
+                # so they can only be dropped on PostgreSQL.
+                if connection.vendor != 'postgresql':
+                    continue
+                for constraint in model._meta.constraints:
+                    cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {connection.ops.quote_name(constraint.name)}")
+
+    def legacy_queries(self):
+        now = timezone.now()
+        brand = Brand.objects.order_by('pk').first()
+        ad = Ad.objects.order_by('pk').first()
+        return {
+            'brand daily spend': AdSpend.objects.filter(ad__brand=brand, date=now.date()),
+            'brand monthly spend': AdSpend.objects.filter(ad__brand=brand, date__month=now.month, date__year=now.year),
+            'ad spend lookup': AdSpend.objects.filter(ad=ad, date=now.date()),
+            'scheduler ads': Ad.objects.exclude(start_time=None).exclude(end_time=None),
+            'active ads': Ad.objects.filter(active=True),
+        }
+
+    def current_queries(self):
+        now = timezone.now()
+        ad = Ad.objects.order_by('pk').first()
+        return {
+            'brand spend totals': brand_spend_totals_query(now),
+            'ad spend lookup': AdSpend.objects.filter(ad=ad, date=now.date()),
+            'scheduler activation': Ad.objects.filter(in_window(now), active=False, paused=False).filter(brand_has_budget()),
+            'scheduler deactivation': Ad.objects.filter(active=True).filter(~in_window(now) | Q(paused=True)),
+            'active ads': Ad.objects.filter(active=True),
+        }
+
+    def explain(self, queries):
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(f"-- {name}"))
+            self.stdout.write(queryset.explain())
+            self.stdout.write("")
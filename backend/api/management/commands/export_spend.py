@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from api.export import ADSPEND_COLUMNS, BRAND_SPEND_COLUMNS, CHUNK_SIZE, EXPORT_OUTPUTS, adspend_rows, brand_spend_rows, render
+
+EXPORTS = {
+    'adspend': (ADSPEND_COLUMNS, adspend_rows),
+    'brand-spend': (BRAND_SPEND_COLUMNS, brand_spend_rows),
+}
+
+
+class Command(BaseCommand):
+    help = "Stream spend history as CSV or NDJSON, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=EXPORTS, help="Per-ad AdSpend rows or the per-brand daily rollup.")
+        parser.add_argument('--output', choices=EXPORT_OUTPUTS, default='csv')
+        parser.add_argument('--from', dest='start', help="First date, YYYY-MM-DD.")
+        parser.add_argument('--to', dest='end', help="Last date, YYYY-MM-DD.")
+        parser.add_argument('--brand', type=int, action='append', dest='brands', help="Only export this brand (repeatable).")
+        parser.add_argument('--file', help="Write here instead of stdout.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start, end = self.parse_date(options['start']), self.parse_date(options['end'])
+        columns, rows = EXPORTS[options['export']]
+        lines = render(options['output'], columns, rows(start, end, options['brands'], options['chunk_size']))
+
+        if options['file']:
+            with open(options['file'], 'w', newline='') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def parse_date(self, value):
+        if value is None:
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD.")
+        return date
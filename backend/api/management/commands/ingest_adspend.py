@@ -0,0 +1,32 @@
+import sys
+from django.core.management.base import BaseCommand
+from api.ingest import CHUNK_SIZE, INGEST_INPUTS, READERS, ingest_adspend
+
+
+class Command(BaseCommand):
+    help = "Upsert externally reported spend from a CSV (ad_id,date,spent) or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' for stdin.")
+        parser.add_argument('--input', choices=INGEST_INPUTS, help="Defaults to ndjson for .ndjson/.jsonl files, else csv.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        if path == '-':
+            result = ingest_adspend(READERS[input_format](sys.stdin), options['chunk_size'])
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as lines:
+                result = ingest_adspend(READERS[input_format](lines), options['chunk_size'])
+
+        for error in result.errors:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        if result.rejected > len(result.errors):
+            self.stderr.write(f"... and {result.rejected - len(result.errors)} more rejected records.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result.rows} records: {result.written} written, {result.rejected} rejected, "
+            f"{result.brands} brands rolled up, {result.ads_deactivated} ads deactivated."
+        ))
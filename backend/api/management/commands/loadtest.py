@@ -0,0 +1,38 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.loadtest import run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GETs at a running server and report throughput and latency, e.g. the WSGI "
+        "server on /api/brands/ against the ASGI one on /api/async/brands/ on the same machine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Server base URL, e.g. http://localhost:8000")
+        parser.add_argument('paths', nargs='+', help="Paths requested in turn, e.g. /api/async/brands/")
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as failed.")
+        parser.add_argument('--json', action='store_true', help="Print the result as JSON.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        try:
+            result = asyncio.run(
+                run_load(options['url'], options['paths'], options['requests'], options['concurrency'], options['timeout'])
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(result.as_dict()))
+            return
+        self.stdout.write(
+            f"{result.url} x{result.concurrency}: {result.requests} requests, {result.errors} errors in "
+            f"{result.elapsed:.2f}s, {result.throughput:.1f} req/s, "
+            f"p50 {result.p50 * 1000:.1f}ms p95 {result.p95 * 1000:.1f}ms p99 {result.p99 * 1000:.1f}ms"
+        )
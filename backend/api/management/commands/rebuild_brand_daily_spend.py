@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.models import Brand
+from api.rollup import rebuild_brand_daily_spend
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild the BrandDailySpend rollup from AdSpend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brand', type=int, action='append', dest='brands', help="Only rebuild this brand (repeatable).")
+
+    def handle(self, *args, **options):
+        brands = Brand.objects.filter(pk__in=options['brands']) if options['brands'] else None
+        rows = rebuild_brand_daily_spend(brands)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} brand daily spend rows."))
@@ -0,0 +1,79 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.db import connection
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+
+# Set PROMETHEUS_MULTIPROC_DIR to aggregate metrics across prefork children
+# and gunicorn/uvicorn workers; see prometheus_client's multiprocess mode.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+TASK_RUNS = Counter('admanager_task_runs', "Task runs by outcome (ok, error, skipped).", ['task', 'outcome'])
+TASK_DURATION = Histogram(
+    'admanager_task_duration_seconds', "Task wall time.", ['task'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+TASK_QUERIES = Histogram(
+    'admanager_task_queries', "Database queries run by one task.", ['task'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250, 1000, 5000),
+)
+TASK_ROWS = Counter('admanager_task_rows', "Counts reported by task results, e.g. activated or written.", ['task', 'result'])
+BRANDS_OVER_BUDGET = Gauge(
+    'admanager_brands_over_budget', "Brands over budget at the last brand spend rollup.", multiprocess_mode='mostrecent',
+)
+
+
+def metrics_registry():
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@contextmanager
+def count_queries():
+    """Yield a one-item list holding the number of queries run on `connection` so far."""
+    count = [0]
+
+    def wrapper(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield count
+
+
+def record_result(task, result):
+    if not isinstance(result, dict):
+        return
+    for key, value in result.items():
+        if isinstance(value, int) and value > 0:
+            TASK_ROWS.labels(task, key).inc(value)
+    if task == 'update_brand_spend' and 'over_budget' in result:
+        BRANDS_OVER_BUDGET.set(result['over_budget'])
+
+
+def instrument(task):
+    """Record runs, duration, query count and result counts of a task."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            with count_queries() as queries:
+                try:
+                    result = func(*args, **kwargs)
+                    outcome = 'ok'
+                finally:
+                    TASK_RUNS.labels(task, outcome).inc()
+                    TASK_DURATION.labels(task).observe(time.perf_counter() - started)
+                    TASK_QUERIES.labels(task).observe(queries[0])
+            record_result(task, result)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_alter_brand_daily_spend_alter_brand_monthly_spend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='spend_watermark',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='adspend',
+            name='active_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:15
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_adspend(apps, schema_editor):
+    # Concurrent update_or_create calls could insert the same (ad, date) twice.
+    # Every copy was computed from the same formula, so keep the newest one.
+    AdSpend = apps.get_model('api', 'AdSpend')
+    duplicates = (
+        AdSpend.objects.values('ad', 'date')
+        .annotate(keep=Max('id'), copies=models.Count('id'))
+        .filter(copies__gt=1)
+    )
+    for duplicate in duplicates:
+        AdSpend.objects.filter(ad=duplicate['ad'], date=duplicate['date']).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_ad_spend_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['active'], name='ad_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['start_time', 'end_time'], name='ad_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adspend',
+            index=models.Index(fields=['date', 'ad'], name='adspend_date_ad_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_adspend, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='adspend',
+            constraint=models.UniqueConstraint(fields=('ad', 'date'), name='adspend_ad_date_unique'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_brand_daily_spend(apps, schema_editor):
+    AdSpend = apps.get_model('api', 'AdSpend')
+    BrandDailySpend = apps.get_model('api', 'BrandDailySpend')
+    totals = AdSpend.objects.values('ad__brand', 'date').annotate(total=Sum('spent')).order_by()
+    BrandDailySpend.objects.bulk_create(
+        (BrandDailySpend(brand_id=row['ad__brand'], date=row['date'], spent=row['total']) for row in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_adspend_unique_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrandDailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spends', to='api.brand')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('brand', 'date'), name='branddailyspend_brand_date_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_brand_daily_spend, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_branddailyspend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='paused',
+            field=models.BooleanField(default=False),
+        ),
+    ]
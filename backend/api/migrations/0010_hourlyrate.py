@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:31
+
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_hourly_rate(apps, schema_editor):
+    # The current rate applies from the start: stored spend keeps its value.
+    Settings = apps.get_model('api', 'Settings')
+    HourlyRate = apps.get_model('api', 'HourlyRate')
+    rate = Settings.objects.values_list('hourly_rate', flat=True).first()
+    HourlyRate.objects.create(effective_date=date(1970, 1, 1), rate=rate or Decimal(str(settings.DEFAULT_HOURLY_RATE)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ad_paused'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_date', models.DateField(unique=True)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.RunPython(seed_hourly_rate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hourlyrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='last_modified',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_brand_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='branddailyspend',
+            index=models.Index(fields=['date', 'brand'], name='branddailyspend_date_brand_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_branddailyspend_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adspend',
+            name='reported',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from datetime import timedelta,datetime
-from math import ceil
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils import timezone
+from .spend import SpendIndex, project_daily_spend
 
 DEFAULT_HOURLY_RATE = settings.DEFAULT_HOURLY_RATE
 
@@ -12,6 +16,15 @@ class Settings(models.Model):
         self.pk = self.id = 1
         super().save(*args, **kwargs)
 
+class HourlyRate(models.Model):
+    # Rate history: spend of a day is priced at the rate effective that day,
+    # so changing the rate never reprices earlier days.
+    effective_date = models.DateField(unique=True)
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.rate}/h from {self.effective_date}"
+
 class Brand(models.Model):
     name = models.CharField(max_length=100)
     daily_budget = models.DecimalField(max_digits=10, decimal_places=2)
@@ -19,64 +32,67 @@ class Brand(models.Model):
     daily_spend = models.DecimalField(max_digits=10, decimal_places=2, default=0, null=True)
     monthly_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0, null=True)
     last_spend_update = models.DateTimeField(default=None, null=True)
+    # Bumped by every write that changes how the brand or any of its ads
+    # serialize; read endpoints derive ETags and Last-Modified from them.
+    version = models.PositiveBigIntegerField(default=0)
+    last_modified = models.DateTimeField(default=None, null=True)
+
+    @classmethod
+    def bump_versions(cls, brands, now=None):
+        """
+        Bump the version of `brands`, ids or a `brand_id` subquery, in one
+        statement. Bump in the transaction of the write it stamps, or after
+        it, never in an earlier one: no reader may see the new version with
+        the old data. Set-based writes bump first inside their transaction,
+        so brand rows are always locked before ads. Returns the number of
+        brands bumped.
+        """
+        return cls.objects.filter(pk__in=brands).update(
+            version=F('version') + 1, last_modified=now or timezone.now()
+        )
+
+    @classmethod
+    def get_spend_indexes(cls, brand_ids):
+        rows = Ad.objects.filter(brand_id__in=brand_ids).values_list('brand_id', 'start_time', 'end_time')
+        indexes = SpendIndex.from_rows(rows)
+        return {brand_id: indexes.get(brand_id) or SpendIndex({}) for brand_id in brand_ids}
+
+    @cached_property
+    def spend_index(self):
+        # Built once per instance; saving the brand or one of its ads through it drops it.
+        rows = self.ads.values_list('brand_id', 'start_time', 'end_time')
+        return SpendIndex.from_rows(rows).get(self.pk) or SpendIndex({})
+
+    def get_spend_index(self):
+        return self.spend_index
+
+    def save(self, *args, **kwargs):
+        # Bumped in the row, never written back from a possibly stale copy.
+        self.last_modified = timezone.now()
+        if self._state.adding:
+            self.version = (self.version or 0) + 1
+        else:
+            self.version = F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'last_modified'}
+        super().save(*args, **kwargs)
+        self.__dict__.pop('spend_index', None)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=['version'])
 
     def get_daily_spend(self):
-        ads = self.ads.all().order_by('-start_time')
-        spend_list = []
-
-        for ad in ads:
-            ad_daily_spends = ad.get_daily_spend()
-            for daily_spend in ad_daily_spends:
-                date_idx = [date_idx for date_idx, date in enumerate(spend_list) if date['date'] == daily_spend['date']]
-                if len(date_idx) > 0:
-                    existingDate = date_idx[0]
-                    spend_list[existingDate] = {
-                        'date': daily_spend['date'],
-                        'duration': daily_spend['duration'] + spend_list[existingDate]['duration']
-                    }
-                else:
-                    spend_list.append({
-                        'date': daily_spend['date'],
-                        'duration': daily_spend['duration']
-                    })
-
-        return spend_list
+        daily = self.get_spend_index().daily
+        return [{'date': date, 'duration': duration} for date, duration in daily.items()]
     
     def get_monthly_spend(self):
-        ads = self.ads.all().order_by('-start_time')
-        spend_list = []
-
-        for ad in ads:
-            ad_daily_spends = ad.get_daily_spend()
-            for daily_spend in ad_daily_spends:
-                date_idx = [date_idx for date_idx, date in enumerate(spend_list) if date['month'] == daily_spend['date'].strftime('%Y-%m')]
-                if len(date_idx) > 0:
-                    existingDate = date_idx[0]
-                    spend_list[existingDate] = {
-                        'month': daily_spend['date'].strftime('%Y-%m'),
-                        'duration': daily_spend['duration'] + spend_list[existingDate]['duration']
-                    }
-                else:
-                    spend_list.append({
-                        'month': daily_spend['date'].strftime('%Y-%m'),
-                        'duration': daily_spend['duration']
-                    })
-        return spend_list
-
+        monthly = self.get_spend_index().monthly
+        return [{'month': month, 'duration': duration} for month, duration in monthly.items()]
 
     def get_month_spend(self, month):
-        spend_list = self.get_monthly_spend()
-        for spend in spend_list:
-            if spend['month'] == month:
-                return spend['duration']
-        return 0
+        return self.get_spend_index().month_spend(month)
 
     def get_date_spend(self, date):
-        spend_list = self.get_daily_spend()
-        for spend in spend_list:
-            if spend['date'] == date:
-                return spend['duration']
-        return 0
+        return self.get_spend_index().date_spend(date)
 
     def __str__(self):
         return f"Brand #{self.name}"
@@ -88,41 +104,165 @@ class Ad(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     last_active_time = models.DateTimeField(default=None, null=True)
+    spend_watermark = models.DateTimeField(default=None, null=True)
+    # Paused ads are never activated, whatever their schedule or budget.
+    paused = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active'], name='ad_active_idx'),
+            models.Index(fields=['start_time', 'end_time'], name='ad_schedule_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The signals moving a re-branded ad's spend run in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        if Ad.brand.is_cached(self):
+            self.brand.__dict__.pop('spend_index', None)
 
     def __str__(self):
         return f"Ad: {self.name} ({self.start_time} - {self.end_time})"
     
     def get_daily_spend(self):
-
-        list = []
-        now = datetime.now(tz=self.start_time.tzinfo) if self.start_time.tzinfo else datetime.now()        
-        current = self.start_time
-        end_time = self.end_time
-
-        if (self.end_time > now):
-            end_time = now
-        
-        while current.date() < end_time.date():
-            # End of the current day
-            day_end = datetime.combine(current.date(), datetime.max.time(), tzinfo=current.tzinfo)
-            duration = day_end - current
-            list.append({
-                'date': current.date(),
-                'duration': ceil(duration.total_seconds() / 3600)
-            })
-            current = day_end + timedelta(seconds=1)  # Move to start of next day
-
-        # Add final partial day
-        duration = end_time - current
-        list.append({
-            'date': current.date(),
-            'duration': ceil(duration.total_seconds() / 3600)
-        })
-
-        return list
+        daily = project_daily_spend([(self.pk, self.start_time, self.end_time)]).get(self.pk, {})
+        return [{'date': date, 'duration': duration} for date, duration in daily.items()]
     
 
 class AdSpend(models.Model):
     ad = models.ForeignKey(Ad, on_delete=models.CASCADE)
     date = models.DateField()
-    spent = models.DecimalField(max_digits=10, decimal_places=2)
\ No newline at end of file
+    spent = models.DecimalField(max_digits=10, decimal_places=2)
+    active_seconds = models.PositiveIntegerField(default=0)
+    # Set by ingestion: externally reported spend is final for its day and
+    # accrual never overwrites it.
+    reported = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ad', 'date'], name='adspend_ad_date_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'ad'], name='adspend_date_ad_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = AdSpend.objects.filter(pk=self.pk).values_list('ad__brand_id', 'date', 'spent').first()
+            super().save(*args, **kwargs)
+
+            brand_id = Ad.objects.values_list('brand_id', flat=True).get(pk=self.ad_id)
+            deltas = defaultdict(Decimal)
+            deltas[(brand_id, self.date)] += Decimal(str(self.spent))
+            if previous:
+                deltas[previous[:2]] -= previous[2]
+            BrandDailySpend.apply_deltas(deltas)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            brand_id = Ad.objects.values_list('brand_id', flat=True).get(pk=self.ad_id)
+            BrandDailySpend.apply_deltas({(brand_id, self.date): -Decimal(str(self.spent))})
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def upsert_spent(cls, rows):
+        """
+        Set `spent` of every `(ad_id, date, spent)` and mark it reported,
+        creating missing rows.
+
+        One multi-row `INSERT ... ON CONFLICT` per batch and no model
+        instances, for bulk imports. Bypasses `save()`: callers keep
+        `BrandDailySpend` in step themselves.
+        """
+        # Adapters are looked up once: the per-field path costs more than the SQL here.
+        ops = connection.ops
+        qn = ops.quote_name
+        table = qn(cls._meta.db_table)
+        spent_field = cls._meta.get_field('spent')
+        adapt_date, adapt_decimal = ops.adapt_datefield_value, ops.adapt_decimalfield_value
+        for idx in range(0, len(rows), 1000):
+            batch = rows[idx:idx + 1000]
+            placeholders = ', '.join(['(%s, %s, %s, 0, %s)'] * len(batch))
+            params = [
+                value
+                for ad_id, date, spent in batch
+                for value in (
+                    ad_id,
+                    adapt_date(date),
+                    adapt_decimal(spent, spent_field.max_digits, spent_field.decimal_places),
+                    True,
+                )
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} ({qn('ad_id')}, {qn('date')}, {qn('spent')}, {qn('active_seconds')}, {qn('reported')}) "
+                    f"VALUES {placeholders} "
+                    f"ON CONFLICT ({qn('ad_id')}, {qn('date')}) DO UPDATE SET "
+                    f"{qn('spent')} = EXCLUDED.{qn('spent')}, {qn('reported')} = EXCLUDED.{qn('reported')}",
+                    params,
+                )
+
+class BrandDailySpend(models.Model):
+    brand = models.ForeignKey(Brand, related_name='daily_spends', on_delete=models.CASCADE)
+    date = models.DateField()
+    spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['brand', 'date'], name='branddailyspend_brand_date_unique'),
+        ]
+        indexes = [
+            # The unsharded rollup reads a date range across every brand.
+            models.Index(fields=['date', 'brand'], name='branddailyspend_date_brand_idx'),
+        ]
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """
+        Add `{(brand_id, date): amount}` to the rollup rows, creating them when missing.
+
+        The addition happens inside the upsert statement itself, so concurrent
+        writers never overwrite each other's deltas.
+        """
+        rows = [(brand_id, date, amount) for (brand_id, date), amount in deltas.items() if amount]
+        if not rows:
+            return
+
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        date_field, spent_field = cls._meta.get_field('date'), cls._meta.get_field('spent')
+        for idx in range(0, len(rows), 500):
+            batch = rows[idx:idx + 500]
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(batch))
+            params = [
+                value
+                for brand_id, date, amount in batch
+                for value in (
+                    brand_id,
+                    date_field.get_db_prep_save(date, connection),
+                    spent_field.get_db_prep_save(amount, connection),
+                )
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} ({qn('brand_id')}, {qn('date')}, {qn('spent')}) VALUES {placeholders} "
+                    f"ON CONFLICT ({qn('brand_id')}, {qn('date')}) "
+                    f"DO UPDATE SET {qn('spent')} = {table}.{qn('spent')} + EXCLUDED.{qn('spent')}",
+                    params,
+                )
+
+    @classmethod
+    def move_ad_spend(cls, moves):
+        """
+        Move the AdSpend of ads that changed brand, `{ad_id: (old_brand_id,
+        new_brand_id)}`, from the old brands' rollup rows to the new ones.
+        Run it in the transaction that moves the ads.
+        """
+        deltas = defaultdict(Decimal)
+        for ad_id, date, spent in AdSpend.objects.filter(ad_id__in=moves).values_list('ad_id', 'date', 'spent'):
+            old_brand_id, new_brand_id = moves[ad_id]
+            deltas[(old_brand_id, date)] -= spent
+            deltas[(new_brand_id, date)] += spent
+        cls.apply_deltas(deltas)
@@ -0,0 +1,93 @@
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class IdCursorPagination(CursorPagination):
+    # Stable under concurrent inserts and a constant-cost seek at any depth.
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    # DRF's paginate_queryset, split around the one query it runs so async
+    # views can await it: page_window() builds the query, set_page() reads it.
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window = self.page_window(queryset, request, view)
+        if window is None:
+            return None
+        return self.set_page(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        window = self.page_window(queryset, request, view)
+        if window is None:
+            return None
+        return self.set_page([obj async for obj in window])
+
+    def page_window(self, queryset, request, view=None):
+        """The unevaluated slice holding the page and one item past it, or None when not paginating."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+        self._window = (offset, reverse, current_position)
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            order = self.ordering[0]
+            is_reversed = order.startswith('-')
+            order_attr = order.lstrip('-')
+
+            if self.cursor.reverse != is_reversed:
+                kwargs = {order_attr + '__lt': current_position}
+            else:
+                kwargs = {order_attr + '__gt': current_position}
+
+            queryset = queryset.filter(**kwargs)
+
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        """Keep the page out of the window's `results` and work out the surrounding cursors."""
+        offset, reverse, current_position = self._window
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
@@ -0,0 +1,50 @@
+import threading
+import time
+from bisect import bisect_right
+from decimal import Decimal
+from django.conf import settings
+from .models import HourlyRate
+
+CENT = Decimal('0.01')
+
+_lock = threading.Lock()
+_table = None
+_loaded_at = 0.0
+
+
+class RateTable:
+    """`HourlyRate` history in memory: `on(day)` is a bisect, no query."""
+
+    def __init__(self, rows):
+        self.dates = [effective_date for effective_date, _ in rows]
+        self.rates = [rate for _, rate in rows]
+
+    def on(self, day):
+        idx = bisect_right(self.dates, day) - 1
+        if idx < 0:
+            return self.rates[0] if self.rates else Decimal(str(settings.DEFAULT_HOURLY_RATE))
+        return self.rates[idx]
+
+    def price(self, hours, day):
+        return (hours * self.on(day)).quantize(CENT)
+
+
+def rate_table():
+    """
+    The rate history, cached in this process.
+
+    Saves in this process invalidate it at once; changes made elsewhere are
+    picked up after `RATE_CACHE_TTL` seconds.
+    """
+    global _table, _loaded_at
+    with _lock:
+        if _table is None or time.monotonic() - _loaded_at > settings.RATE_CACHE_TTL:
+            _table = RateTable(list(HourlyRate.objects.order_by('effective_date').values_list('effective_date', 'rate')))
+            _loaded_at = time.monotonic()
+        return _table
+
+
+def invalidate_rates():
+    global _table
+    with _lock:
+        _table = None
@@ -0,0 +1,30 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson when it is installed, for the same
+    bytes: compact, UTF-8 as is and U+2028/U+2029 escaped. Dates, times,
+    Decimals and anything else orjson would write differently still go
+    through DRF's encoder, as do payloads orjson refuses. Floats don't: in
+    exponent form orjson writes them differently (`1e-05` vs `0.00001`), so
+    use it only for views whose payloads hold none.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            # Non-string keys, integers over 64 bits...
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,150 @@
+from dataclasses import dataclass, asdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .brand_state import invalidate_brand_states
+from .events import budget_exhausted_events, publish
+from .models import Ad, AdSpend, Brand, BrandDailySpend
+from .scheduler import flip_ads
+
+BATCH_SIZE = 1000
+ZERO = Decimal('0.00')
+
+
+@dataclass
+class RollupResult:
+    brands: int = 0
+    updated: int = 0
+    exhausted: int = 0
+    over_budget: int = 0
+    ads_deactivated: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def over_budget(prefix=''):
+    return (
+        Q(**{f'{prefix}monthly_budget__lte': Coalesce(F(f'{prefix}monthly_spend'), Value(ZERO))})
+        | Q(**{f'{prefix}daily_budget__lte': Coalesce(F(f'{prefix}daily_spend'), Value(ZERO))})
+    )
+
+
+def brand_spend_totals_query(now, brands=None):
+    """Today's and this month's spend per brand, summed from at most ~31 rollup rows each."""
+    today = now.date()
+    spends = BrandDailySpend.objects.filter(date__gte=today.replace(day=1), date__lte=today)
+    if brands is not None:
+        spends = spends.filter(brand__in=brands)
+
+    return (
+        spends.values('brand')
+        .annotate(daily=Sum('spent', filter=Q(date=today)), monthly=Sum('spent'))
+        .values_list('brand', 'daily', 'monthly')
+    )
+
+
+def brand_spend_totals(now, brands=None):
+    rows = brand_spend_totals_query(now, brands)
+    return {brand_id: (daily or ZERO, monthly or ZERO) for brand_id, daily, monthly in rows}
+
+
+def rollup_brand_spend(now=None, brands=None):
+    """
+    Refresh `Brand.daily_spend`/`monthly_spend` and stop ads of brands over budget.
+
+    Totals are computed in one grouped query over the month to date, only
+    brands whose totals changed are written, with their `last_spend_update`
+    and version, and the ads of every brand over
+    budget are deactivated set-based. Brands that ran out of budget in this
+    run are announced in the event log. `brands` narrows the run.
+    """
+    now = now or timezone.now()
+    brands = Brand.objects.all() if brands is None else brands
+    totals = brand_spend_totals(now, brands)
+    result = RollupResult()
+
+    changed, exhausted = [], []
+    for brand in brands.only('id', 'daily_budget', 'monthly_budget', 'daily_spend', 'monthly_spend'):
+        result.brands += 1
+        daily, monthly = totals.get(brand.pk, (ZERO, ZERO))
+        if brand.daily_spend == daily and brand.monthly_spend == monthly:
+            continue
+
+        had_budget = brand.monthly_budget > (brand.monthly_spend or ZERO) and brand.daily_budget > (brand.daily_spend or ZERO)
+        brand.daily_spend, brand.monthly_spend = daily, monthly
+        if had_budget and (brand.monthly_budget <= monthly or brand.daily_budget <= daily):
+            exhausted.append(brand.pk)
+        changed.append(brand)
+    result.exhausted = len(exhausted)
+
+    for brand in changed:
+        # Only brands whose spend moved are stamped, so unchanged ones keep their ETags.
+        brand.last_spend_update = brand.last_modified = now
+        brand.version = F('version') + 1
+
+    with transaction.atomic():
+        Brand.objects.bulk_update(
+            changed, ['daily_spend', 'monthly_spend', 'last_spend_update', 'version', 'last_modified'],
+            batch_size=BATCH_SIZE,
+        )
+        if changed:
+            transaction.on_commit(lambda: invalidate_brand_states(brand.pk for brand in changed))
+        result.updated = len(changed)
+        result.over_budget = brands.filter(over_budget()).count()
+        publish(budget_exhausted_events(exhausted, now))
+        result.ads_deactivated = flip_ads(
+            Ad.objects.filter(brand__in=brands, active=True).filter(over_budget('brand__')),
+            now, 'ad.deactivated', 'budget', active=False,
+        )
+
+    return result
+
+
+def _brand_id_batches(brands=None, size=BATCH_SIZE):
+    brands = Brand.objects.all() if brands is None else brands
+    ids = list(brands.order_by('pk').values_list('pk', flat=True))
+    for idx in range(0, len(ids), size):
+        yield ids[idx:idx + size]
+
+
+def _adspend_daily_totals(brand_ids):
+    rows = (
+        AdSpend.objects.filter(ad__brand__in=brand_ids)
+        .values('ad__brand', 'date')
+        .annotate(total=Sum('spent'))
+        .values_list('ad__brand', 'date', 'total')
+    )
+    return {(brand_id, date): total for brand_id, date, total in rows}
+
+
+def find_brand_daily_spend_drift(brands=None):
+    """Yield (brand_id, date, expected, stored) for every rollup row that disagrees with `AdSpend`."""
+    for batch in _brand_id_batches(brands):
+        expected = _adspend_daily_totals(batch)
+        stored = {
+            (brand_id, date): spent
+            for brand_id, date, spent in BrandDailySpend.objects.filter(brand__in=batch).values_list('brand', 'date', 'spent')
+        }
+        for key in sorted(expected.keys() | stored.keys()):
+            if expected.get(key, ZERO) != stored.get(key, ZERO):
+                yield key[0], key[1], expected.get(key, ZERO), stored.get(key, ZERO)
+
+
+def rebuild_brand_daily_spend(brands=None):
+    """Recreate `BrandDailySpend` from `AdSpend`, one transaction per batch of brands."""
+    rows = 0
+    for batch in _brand_id_batches(brands):
+        with transaction.atomic():
+            BrandDailySpend.objects.filter(brand__in=batch).delete()
+            created = BrandDailySpend.objects.bulk_create(
+                [
+                    BrandDailySpend(brand_id=brand_id, date=date, spent=total)
+                    for (brand_id, date), total in _adspend_daily_totals(batch).items()
+                ],
+                batch_size=BATCH_SIZE,
+            )
+            rows += len(created)
+    return rows
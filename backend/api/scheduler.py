@@ -0,0 +1,88 @@
+from dataclasses import dataclass, asdict
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .budget import get_budget_counters
+from .events import ad_events, get_event_log, publish
+from .models import Ad, Brand
+
+
+@dataclass
+class SchedulerResult:
+    activated: int = 0
+    deactivated: int = 0
+    budget_blocked: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def brand_has_budget():
+    # A brand can spend while both budgets are above the current spend. Missing
+    # spend values (brands never rolled up) count as nothing spent.
+    return (
+        Q(brand__monthly_budget__gt=Coalesce(F('brand__monthly_spend'), Value(0)))
+        & Q(brand__daily_budget__gt=Coalesce(F('brand__daily_spend'), Value(0)))
+    )
+
+
+def in_window(now):
+    return Q(start_time__lte=now, end_time__gte=now)
+
+
+def flip_ads(ads, now, event_type, reason, **values):
+    """
+    Apply `values` to `ads`, bumping their brands first, and announce each
+    flipped ad as `event_type`. Returns the number of ads written.
+
+    Without an event log this is set-based, the update being skipped when
+    no brand was bumped. With one, the ad ids are read first so the events
+    can name them. Run it inside a transaction.
+    """
+    if get_event_log() is None:
+        if not Brand.bump_versions(ads.values('brand_id'), now):
+            return 0
+        return ads.update(**values)
+
+    rows = list(ads.values_list('id', 'brand_id'))
+    if not rows:
+        return 0
+    Brand.bump_versions({brand_id for _, brand_id in rows}, now)
+    Ad.objects.filter(pk__in=[ad_id for ad_id, _ in rows]).update(**values)
+    publish(ad_events(event_type, rows, now, reason))
+    return len(rows)
+
+
+def schedule_ads(now=None, ads=None):
+    """
+    Flip `Ad.active` for every ad whose schedule, pause or brand budget requires it.
+
+    Runs a fixed number of set-based statements and only writes rows whose
+    state actually changes. `ads` narrows the run to a subset of the catalog.
+    Brands of the flipped ads get their version bumped.
+    """
+    now = now or timezone.now()
+    ads = Ad.objects.all() if ads is None else ads
+    result = SchedulerResult()
+
+    # Bumps and flips commit together. No savepoint: nothing here is retried
+    # on error, and callers such as bulk_write_ads already run in a transaction.
+    with transaction.atomic(savepoint=False):
+        expired = ads.filter(active=True).filter(~in_window(now) | Q(paused=True))
+        result.deactivated = flip_ads(expired, now, 'ad.deactivated', 'schedule', active=False)
+
+        pending = ads.filter(in_window(now), active=False, paused=False)
+        pending_count = pending.count()
+        if pending_count:
+            counters = get_budget_counters()
+            if counters is not None:
+                # Live counters know which brands are out of budget, no Brand join needed.
+                has_budget = ~Q(brand_id__in=counters.exhausted_brand_ids(now.date()))
+            else:
+                has_budget = brand_has_budget()
+            due = pending.filter(has_budget)
+            result.activated = flip_ads(due, now, 'ad.activated', 'schedule', active=True, last_active_time=now)
+            result.budget_blocked = pending_count - result.activated
+
+    return result
@@ -1,6 +1,14 @@
 from rest_framework import serializers
+from .analytics import GRANULARITIES
+from .events import EVENT_ID_RE
+from .export import EXPORT_OUTPUTS
+from .ingest import INGEST_INPUTS
 from .models import Settings, Brand, Ad
 
+BULK_MAX_ITEMS = 5000
+EVENTS_MAX_LIMIT = 1000
+EVENTS_MAX_WAIT = 30.0
+
 class SettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Settings
@@ -9,11 +17,107 @@ class SettingsSerializer(serializers.ModelSerializer):
 class AdSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ad
-        fields = '__all__'
+        # Accrual's own bookkeeping: writing it would skip or re-bill spend,
+        # and it moves every tick, which would change the ads' ETags with it.
+        exclude = ('spend_watermark',)
 
-class BrandSerializer(serializers.ModelSerializer):
-    ads = AdSerializer(many=True, read_only=True)
+class BulkAdSerializer(serializers.ModelSerializer):
+    # A plain id: brands are checked for all items at once instead of one query each.
+    brand = serializers.IntegerField(source='brand_id', min_value=1)
 
+    class Meta:
+        model = Ad
+        fields = ('name', 'brand', 'start_time', 'end_time', 'paused')
+
+class BulkAdUpdateSerializer(BulkAdSerializer):
+    id = serializers.IntegerField(min_value=1)
+
+    class Meta(BulkAdSerializer.Meta):
+        fields = ('id',) + BulkAdSerializer.Meta.fields
+
+    def validate(self, attrs):
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        return attrs
+
+class BulkAdRequestSerializer(serializers.Serializer):
+    create = serializers.ListField(child=serializers.DictField(), default=list)
+    update = serializers.ListField(child=serializers.DictField(), default=list)
+    pause = serializers.ListField(child=serializers.IntegerField(min_value=1), default=list)
+    resume = serializers.ListField(child=serializers.IntegerField(min_value=1), default=list)
+
+    def validate(self, attrs):
+        items = sum(len(items) for items in attrs.values())
+        if not items:
+            raise serializers.ValidationError("Nothing to do.")
+        if items > BULK_MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {BULK_MAX_ITEMS} items per request, got {items}.")
+        if set(attrs['pause']) & set(attrs['resume']):
+            raise serializers.ValidationError("An ad can't be paused and resumed in the same request.")
+        return attrs
+
+class BrandSerializer(serializers.ModelSerializer):
     class Meta:
         model = Brand
-        fields = '__all__'
\ No newline at end of file
+        # Version stamps travel in the ETag and Last-Modified headers.
+        exclude = ('version', 'last_modified')
+
+class BrandWithAdsSerializer(BrandSerializer):
+    # Filled by BrandViewSet's prefetch, which may hold only the first ads of each brand.
+    ads = AdSerializer(source='embedded_ads', many=True, read_only=True)
+
+    class Meta(BrandSerializer.Meta):
+        pass
+
+class DateRangeQuerySerializer(serializers.Serializer):
+    def get_fields(self):
+        # `from` is a keyword, so the range bounds can't be declared as attributes.
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField(required=False)
+        fields['to'] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        if attrs.get('from') and attrs.get('to') and attrs['from'] > attrs['to']:
+            raise serializers.ValidationError({'to': '`to` must not be before `from`.'})
+        return attrs
+
+class SpendQuerySerializer(DateRangeQuerySerializer):
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default='day')
+
+class BulkSpendQuerySerializer(SpendQuerySerializer):
+    brand = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=500)
+
+class SpendPointSerializer(serializers.Serializer):
+    period = serializers.SerializerMethodField()
+    spent = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+    def get_period(self, point):
+        period = point['period']
+        return period.strftime('%Y-%m') if self.context.get('granularity') == 'month' else period.isoformat()
+
+class ExportQuerySerializer(DateRangeQuerySerializer):
+    # `format` is taken by DRF's renderer override.
+    output = serializers.ChoiceField(choices=EXPORT_OUTPUTS, default='csv')
+    brand = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+class IngestQuerySerializer(serializers.Serializer):
+    input = serializers.ChoiceField(choices=INGEST_INPUTS, default='csv')
+    chunk_size = serializers.IntegerField(min_value=1, max_value=50000, required=False)
+
+class BrandStateSerializer(serializers.Serializer):
+    # Money as strings, with the places of the Brand columns, like every other endpoint.
+    brand = serializers.IntegerField()
+    daily_budget = serializers.DecimalField(max_digits=10, decimal_places=2)
+    monthly_budget = serializers.DecimalField(max_digits=12, decimal_places=2)
+    daily_spend = serializers.DecimalField(max_digits=10, decimal_places=2)
+    monthly_spend = serializers.DecimalField(max_digits=12, decimal_places=2)
+    has_budget = serializers.BooleanField()
+
+class BrandBudgetQuerySerializer(serializers.Serializer):
+    brand = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000)
+
+class EventQuerySerializer(serializers.Serializer):
+    after = serializers.RegexField(EVENT_ID_RE, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=EVENTS_MAX_LIMIT, default=100)
+    wait = serializers.FloatField(min_value=0, max_value=EVENTS_MAX_WAIT, default=0)
@@ -0,0 +1,73 @@
+from collections import Counter
+from django.db import connection, transaction
+from django.utils import timezone
+from .accrual import accrue_ad_spend
+from .models import Ad, Brand
+from .rollup import rollup_brand_spend
+from .scheduler import schedule_ads
+
+# Namespaces our advisory locks so they never clash with other users of them.
+BRAND_LOCK_CLASS = 0x4252
+
+
+def brand_shards(shard_size):
+    """Split the brand catalog into `[(first_id, last_id)]` ranges of at most `shard_size` brands."""
+    ids = list(Brand.objects.order_by('pk').values_list('pk', flat=True))
+    return [(ids[idx], ids[min(idx + shard_size, len(ids)) - 1]) for idx in range(0, len(ids), shard_size)]
+
+
+def lock_brands(first_id, last_id):
+    """
+    Take a transaction-scoped advisory lock on every brand of the range that
+    no other worker holds, and return the ids that were locked.
+
+    Must run inside a transaction. Backends without advisory locks (SQLite
+    only allows one writer anyway) get every brand of the range.
+    """
+    if connection.vendor != 'postgresql':
+        return list(Brand.objects.filter(pk__gte=first_id, pk__lte=last_id).values_list('pk', flat=True))
+
+    table = connection.ops.quote_name(Brand._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM {table} WHERE id BETWEEN %s AND %s "
+            f"AND pg_try_advisory_xact_lock(%s, (id %% 2147483647)::int) ORDER BY id",
+            [first_id, last_id, BRAND_LOCK_CLASS],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def process_brand_shard(first_id, last_id, now=None):
+    """
+    Run accrual, rollup and scheduling for the brands of one id range.
+
+    Brands locked by another worker are skipped and picked up next tick.
+    Live budget counters are fed once the shard has committed, so results
+    are read after it.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        brand_ids = lock_brands(first_id, last_id)
+        result = Counter(brands_locked=len(brand_ids))
+        result['brands_skipped'] = Brand.objects.filter(pk__gte=first_id, pk__lte=last_id).count() - len(brand_ids)
+        if not brand_ids:
+            return dict(result)
+
+        brands = Brand.objects.filter(pk__in=brand_ids)
+        ads = Ad.objects.filter(brand__in=brand_ids)
+        stages = (
+            ('adspend', accrue_ad_spend(now, ads=ads)),
+            ('brand_spend', rollup_brand_spend(now, brands)),
+            ('scheduler', schedule_ads(now, ads)),
+        )
+
+    for stage, stage_result in stages:
+        result.update({f'{stage}_{key}': value for key, value in stage_result.as_dict().items()})
+    return dict(result)
+
+
+def merge_shard_results(results):
+    totals = Counter(shards=len(results))
+    for result in results:
+        totals.update(result)
+    return dict(totals)
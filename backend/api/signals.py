@@ -0,0 +1,80 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .brand_state import invalidate_brand_states
+from .budget import get_budget_counters
+from .models import Ad, AdSpend, Brand, BrandDailySpend, HourlyRate, Settings
+from .rates import invalidate_rates
+from .timeline import replan_ads
+
+
+@receiver(pre_delete, sender=Ad)
+def remove_ad_spend_from_rollup(sender, instance, **kwargs):
+    # Cascaded AdSpend deletes skip AdSpend.delete(), so take the ad's spend
+    # out of its brand's daily rollup before the rows go away.
+    deltas = defaultdict(Decimal)
+    for date, spent in AdSpend.objects.filter(ad=instance).values_list('date', 'spent'):
+        deltas[(instance.brand_id, date)] -= spent
+    BrandDailySpend.apply_deltas(deltas)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_brand_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_brand_states([instance.pk]))
+
+
+@receiver(pre_save, sender=Ad)
+def remember_ad_brand(sender, instance, raw=False, **kwargs):
+    # An ad moved to another brand changes how both brands serialize.
+    if not raw and not instance._state.adding:
+        instance._previous_brand_id = Ad.objects.filter(pk=instance.pk).values_list('brand_id', flat=True).first()
+
+
+@receiver(post_save, sender=Ad)
+def move_ad_spend(sender, instance, raw=False, **kwargs):
+    # The ad's past spend now counts against its new brand.
+    previous = getattr(instance, '_previous_brand_id', None)
+    if not raw and previous is not None and previous != instance.brand_id:
+        BrandDailySpend.move_ad_spend({instance.pk: (previous, instance.brand_id)})
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+def bump_ad_brand_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Brand.bump_versions({instance.brand_id, getattr(instance, '_previous_brand_id', None)} - {None})
+
+
+@receiver(post_save, sender=Brand)
+def recheck_live_budget(sender, instance, **kwargs):
+    counters = get_budget_counters()
+    if counters is not None:
+        counters.recheck(instance.pk, instance.daily_budget, instance.monthly_budget, timezone.now().date())
+
+    if settings.AD_TIMELINE_ENABLED:
+        # A budget change can let this brand's ads run again without any schedule instant.
+        from .tasks import task_apply_transitions
+        transaction.on_commit(lambda: task_apply_transitions.delay(brand_ids=[instance.pk]))
+
+
+@receiver(post_save, sender=Ad)
+def replan_ad_timeline(sender, instance, **kwargs):
+    if settings.AD_TIMELINE_ENABLED:
+        transaction.on_commit(lambda: replan_ads([instance.pk]))
+
+
+@receiver(post_save, sender=Settings)
+def record_hourly_rate(sender, instance, **kwargs):
+    # The new rate prices today onwards; earlier days keep theirs.
+    HourlyRate.objects.update_or_create(effective_date=timezone.now().date(), defaults={'rate': instance.hourly_rate})
+
+
+@receiver(post_save, sender=HourlyRate)
+@receiver(post_delete, sender=HourlyRate)
+def reload_hourly_rates(sender, **kwargs):
+    transaction.on_commit(invalidate_rates)
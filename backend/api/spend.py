@@ -0,0 +1,140 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time
+from itertools import accumulate
+from math import ceil
+
+# Ad.get_daily_spend historically walked days with `day_end + 1 second`, so
+# every day after the first is measured from this instant instead of midnight.
+DAY_RESUME = time(0, 0, 0, 999999)
+FULL_DAY_HOURS = ceil((datetime.combine(date.min, time.max) - datetime.combine(date.min, DAY_RESUME)).total_seconds() / 3600)
+
+
+def _hours(delta):
+    return ceil(delta.total_seconds() / 3600)
+
+
+def _now_for(start, now):
+    if now is None:
+        return datetime.now(tz=start.tzinfo) if start.tzinfo else datetime.now()
+    if (start.tzinfo is None) != (now.tzinfo is None):
+        now = now.astimezone(start.tzinfo)
+        if start.tzinfo is None:
+            now = now.replace(tzinfo=None)
+    return now
+
+
+def ad_day_buckets(start, end, now=None):
+    """
+    Split one ad's run into (first_day, first_hours, last_day, last_hours, full_days).
+
+    `full_days` is the number of whole days strictly between the first and the
+    last day, each worth FULL_DAY_HOURS. `last_hours` is None for single day runs.
+    """
+    now = _now_for(start, now)
+    if end > now:
+        end = now
+
+    first, last = start.date(), end.date()
+    if first >= last:
+        return first, _hours(end - start), first, None, 0
+
+    head = _hours(datetime.combine(first, time.max, tzinfo=start.tzinfo) - start)
+    tail = _hours(end - datetime.combine(last, DAY_RESUME, tzinfo=start.tzinfo))
+    return first, head, last, tail, last.toordinal() - first.toordinal() - 1
+
+
+def project_daily_spend(rows, now=None):
+    """
+    Project hour totals per day for many ads at once.
+
+    `rows` is an iterable of (key, start_time, end_time), typically
+    `Ad.objects.values_list('brand_id', 'start_time', 'end_time')`. Returns
+    `{key: {date: hours}}` with dates in ascending order.
+
+    Each ad contributes two point values (its first and last day) and a range
+    of full days, which is recorded in a difference array instead of being
+    walked day by day. One sweep per key then produces every covered day.
+    """
+    points = defaultdict(lambda: defaultdict(int))
+    steps = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+
+    for key, start, end in rows:
+        first, head, last, tail, full_days = ad_day_buckets(start, end, now)
+        first, last = first.toordinal(), last.toordinal()
+        key_points, key_steps = points[key], steps[key]
+
+        key_points[first] += head
+        if tail is not None:
+            key_points[last] += tail
+        if full_days:
+            key_steps[first + 1][0] += FULL_DAY_HOURS
+            key_steps[last][0] -= FULL_DAY_HOURS
+        # Coverage tells which days exist in the output, even with 0 hours.
+        key_steps[first][1] += 1
+        key_steps[last + 1][1] -= 1
+
+    projection = {}
+    for key, key_steps in steps.items():
+        key_points = points[key]
+        boundaries = sorted(key_steps.keys() | key_points.keys())
+        daily = {}
+        running = covered = 0
+
+        for idx, ordinal in enumerate(boundaries[:-1]):
+            hours_step, cover_step = key_steps.get(ordinal, (0, 0))
+            running += hours_step
+            covered += cover_step
+            if not covered:
+                continue
+            for day in range(ordinal, boundaries[idx + 1]):
+                daily[date.fromordinal(day)] = running + key_points.get(day, 0)
+
+        projection[key] = daily
+
+    return projection
+
+
+def project_monthly_spend(daily_projection):
+    """Fold `project_daily_spend` output into `{key: {'YYYY-MM': hours}}`."""
+    projection = {}
+    for key, daily in daily_projection.items():
+        monthly = defaultdict(int)
+        for day, hours in daily.items():
+            monthly[day.strftime('%Y-%m')] += hours
+        projection[key] = dict(monthly)
+    return projection
+
+
+class SpendIndex:
+    """
+    Read-only spend history of one key (usually a brand), indexed by day and month.
+
+    Build it once per request or task and reuse it: point lookups are dict
+    reads and `spend_between` is two bisects over cumulative totals.
+    """
+
+    def __init__(self, daily):
+        self.daily = dict(sorted(daily.items()))
+        self.monthly = project_monthly_spend({None: self.daily})[None]
+        self._dates = list(self.daily)
+        self._cumulative = list(accumulate(self.daily.values()))
+
+    @classmethod
+    def from_rows(cls, rows, now=None):
+        """Build one index per key from (key, start_time, end_time) rows."""
+        return {key: cls(daily) for key, daily in project_daily_spend(rows, now).items()}
+
+    def date_spend(self, day):
+        return self.daily.get(day, 0)
+
+    def month_spend(self, month):
+        return self.monthly.get(month, 0)
+
+    def spend_between(self, start, end):
+        """Total hours from `start` to `end`, both dates inclusive."""
+        lo = bisect_left(self._dates, start)
+        hi = bisect_right(self._dates, end)
+        if hi <= lo:
+            return 0
+        return self._cumulative[hi - 1] - (self._cumulative[lo - 1] if lo else 0)
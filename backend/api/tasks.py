@@ -1,74 +1,109 @@
 import logging
-from datetime import datetime
-from math import ceil
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
 from django.utils import timezone
-from .models import Brand, Ad, AdSpend, Settings
-from django.db.models import Sum
+from .accrual import accrue_ad_spend
+from .budget import sync_budget_counters
+from .metrics import instrument
+from .models import Ad
+from .rollup import rollup_brand_spend
+from .scheduler import schedule_ads
+from .sharding import brand_shards, merge_shard_results, process_brand_shard
+from .ticks import tick_guard
+from .timeline import plan_timeline
 
 logger = logging.getLogger(__name__)
 
 @shared_task
+@tick_guard('ad_scheduler')
+@instrument('ad_scheduler')
 def task_ad_scheduler():
-    now = timezone.now()
-    ads = Ad.objects.exclude(start_time=None).exclude(end_time=None)
-
-    for ad in ads:
-        adLastState = ad.active
-        
-        if ad.start_time <= now <= ad.end_time:
-            if ad.brand.monthly_budget > ad.brand.monthly_spend and ad.brand.daily_budget > ad.brand.daily_spend:
-                ad.active = True
-            
-                if not adLastState:
-                    ad.last_active_time = datetime.now()
-                    logging.info(f"Ad {ad.id} activated.")
-            else:
-                print(f"Ad {ad.id} not activated due budget exceeded.")
-        else:
-            ad.active = False
-            if adLastState:
-                logging.info(f"Ad {ad.id} has been deactivated.")
-        
-        ad.save()
+    result = schedule_ads(timezone.now())
+
+    logger.info(
+        f"Ad scheduler: {result.activated} activated, {result.deactivated} deactivated, "
+        f"{result.budget_blocked} not activated due budget exceeded."
+    )
+    return result.as_dict()
 
 @shared_task
-def task_update_adspend():
+@instrument('apply_transitions')
+def task_apply_transitions(ad_ids=None, brand_ids=None):
     now = timezone.now()
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    active_ads = Ad.objects.filter(active=True)
-    
-    for active_ad in active_ads:
-        start_time = today
-        end_time = now
+    if ad_ids is None and brand_ids is None:
+        # Day rollover or planner catch-up: reset spend first, then re-evaluate everything.
+        rollup_brand_spend(now)
+        result = schedule_ads(now)
+    else:
+        ads = Ad.objects.all()
+        if ad_ids is not None:
+            ads = ads.filter(pk__in=ad_ids)
+        if brand_ids is not None:
+            ads = ads.filter(brand__in=brand_ids)
+        result = schedule_ads(now, ads)
+
+    logger.info(f"Ad transitions: {result.activated} activated, {result.deactivated} deactivated.")
+    return result.as_dict()
+
+@shared_task
+@tick_guard('plan_timeline', settings.AD_TIMELINE_HORIZON)
+@instrument('plan_timeline')
+def task_plan_timeline():
+    planned = plan_timeline(timezone.now())
 
-        if (active_ad.last_active_time > today):
-            start_time = active_ad.last_active_time        
+    logger.info(f"Ad timeline: {planned} transition instants planned.")
+    return planned
 
-        spend = end_time - start_time
-        AdSpend.objects.update_or_create(ad=active_ad, date=today.date(), defaults={'spent': ceil(spend.total_seconds() / 3600)})
+@shared_task
+@tick_guard('update_adspend')
+@instrument('update_adspend')
+def task_update_adspend():
+    result = accrue_ad_spend(timezone.now())
 
+    logger.info(f"Ad spend: {result.ads} active ads, {result.written} rows written, {result.accumulated} accumulated.")
+    return result.as_dict()
 
 @shared_task
+@tick_guard('update_brand_spend')
+@instrument('update_brand_spend')
 def task_update_brand_spend():
+    result = rollup_brand_spend(timezone.now())
+
+    logger.info(
+        f"Brand spend: {result.updated} of {result.brands} brands changed, {result.exhausted} exhausted their budget, "
+        f"{result.over_budget} over budget, {result.ads_deactivated} ads deactivated."
+    )
+    return result.as_dict()
+
+@shared_task
+@tick_guard('sync_budget_counters', settings.BUDGET_COUNTER_SYNC_INTERVAL)
+@instrument('sync_budget_counters')
+def task_sync_budget_counters():
+    updated = sync_budget_counters(timezone.now())
+
+    logger.info(f"Budget counters: {updated} brands flushed.")
+    return updated
+
+@shared_task
+@instrument('process_brand_shard')
+def task_process_brand_shard(first_id, last_id):
+    return process_brand_shard(first_id, last_id, timezone.now())
+
+@shared_task
+@instrument('merge_shard_results')
+def task_merge_shard_results(results):
+    totals = merge_shard_results(results)
+
+    logger.info(f"Brand shards: {totals}")
+    return totals
+
+@shared_task
+@tick_guard('fanout_brands')
+@instrument('fanout_brands')
+def task_fanout_brands(shard_size=None):
+    shards = brand_shards(shard_size or settings.BRAND_SHARD_SIZE)
+    if not shards:
+        return 0
 
-    current_day = timezone.now()
-    
-    for brand in Brand.objects.all():
-        if (brand.last_spend_update != current_day):
-            brand.daily_spend = 0
-            if (brand.last_spend_update and brand.last_spend_update.month != current_day.month):
-                brand.monthly_spend = 0
-            brand.last_spend_update = current_day
-            brand.save()
-
-        current_day_spend = AdSpend.objects.filter(ad__brand=brand, date=current_day.date()).aggregate(Sum('spent'))['spent__sum']
-        current_month_spend = AdSpend.objects.filter(ad__brand=brand, date__month=current_day.month, date__year=current_day.year).aggregate(Sum('spent'))['spent__sum']
-    
-        brand.daily_spend = current_day_spend
-        brand.monthly_spend = current_month_spend
-        brand.last_spend_update = current_day
-        brand.save()
-
-        if brand.monthly_budget <= brand.monthly_spend or brand.daily_budget <= brand.daily_spend:
-            brand.ads.filter(active=True).update(active=False)
\ No newline at end of file
+    chord(task_process_brand_shard.s(first_id, last_id) for first_id, last_id in shards)(task_merge_shard_results.s())
+    return len(shards)
@@ -1,9 +1,37 @@
+import asyncio
+import json
+import tempfile
 from datetime import datetime, timedelta
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from freezegun import freeze_time
-from .models import AdSpend, Brand, Ad
-from .tasks import task_update_adspend, task_ad_scheduler, task_update_brand_spend
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from .accrual import accrue_ad_spend
+from .models import AdSpend, Brand, BrandDailySpend, Ad, HourlyRate, Settings
+from .sharding import brand_shards, merge_shard_results, process_brand_shard
+from .spend import project_daily_spend, project_monthly_spend
+from .brand_state import get_brand_state, local_states
+from .budget import get_budget_counters
+from .columnar import field_plan
+from .events import InMemoryEventLog, get_event_log
+from .loadtest import run_load
+from .metrics import REGISTRY
+from .rates import invalidate_rates, rate_table
+from .renderers import FastJSONRenderer
+from .scheduler import schedule_ads
+from .serializers import AdSerializer, BrandSerializer, BrandWithAdsSerializer, SpendPointSerializer
+from .tasks import task_update_adspend, task_ad_scheduler, task_update_brand_spend, task_sync_budget_counters, task_apply_transitions, task_fanout_brands
+from .ticks import get_tick_store
+from .timeline import PLANNED_UNTIL_KEY, next_transitions, plan_timeline
 
 class BrandTestCase(TestCase):
     def setUp(self):
@@ -147,6 +175,13 @@ class AdTestCase(TestCase):
         self.assertEqual(self.ad.start_time, datetime(2023, 1, 1, 9, 0))
         self.assertEqual(self.ad.end_time, datetime(2023, 1, 1, 17, 0))
 
+    def test_spend_watermark_is_internal(self):
+        response = self.client.patch(f'/api/ads/{self.ad.pk}/', {'spend_watermark': '2099-01-01T00:00:00Z'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('spend_watermark', response.json())
+        self.ad.refresh_from_db()
+        self.assertIsNone(self.ad.spend_watermark)
+
     def test_ad_spend_with_1_day(self):
         self.assertEqual(self.ad.get_daily_spend(), [{
             "date": datetime(2023, 1, 1).date(), 
@@ -184,6 +219,93 @@ class AdTestCase(TestCase):
             "duration": 2
         }])
 
+class SpendProjectionTestCase(TestCase):
+    def setUp(self):
+        self.brand1 = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.brand2 = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00)
+
+        Ad.objects.create(brand=self.brand1, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 3, 12, 0))
+        Ad.objects.create(brand=self.brand1, name="Ad 2", start_time=datetime(2023, 1, 5, 9, 0), end_time=datetime(2023, 1, 5, 10, 0))
+        Ad.objects.create(brand=self.brand2, name="Ad 3", start_time=datetime(2023, 1, 31, 22, 0), end_time=datetime(2023, 2, 1, 2, 0))
+
+    def test_project_many_brands_in_one_pass(self):
+        rows = Ad.objects.values_list('brand_id', 'start_time', 'end_time')
+        daily = project_daily_spend(rows)
+
+        self.assertEqual(daily, {
+            self.brand1.pk: {
+                datetime(2023, 1, 1).date(): 15,
+                datetime(2023, 1, 2).date(): 24,
+                datetime(2023, 1, 3).date(): 12,
+                datetime(2023, 1, 5).date(): 1,
+            },
+            self.brand2.pk: {
+                datetime(2023, 1, 31).date(): 2,
+                datetime(2023, 2, 1).date(): 2,
+            },
+        })
+        self.assertEqual(project_monthly_spend(daily), {
+            self.brand1.pk: {'2023-01': 52},
+            self.brand2.pk: {'2023-01': 2, '2023-02': 2},
+        })
+
+    def test_brand_daily_spend_skips_uncovered_days(self):
+        self.assertEqual([spend['date'] for spend in self.brand1.get_daily_spend()], [
+            datetime(2023, 1, 1).date(),
+            datetime(2023, 1, 2).date(),
+            datetime(2023, 1, 3).date(),
+            datetime(2023, 1, 5).date(),
+        ])
+
+class SpendIndexTestCase(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.other = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00)
+
+        Ad.objects.create(brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 30, 9, 0), end_time=datetime(2023, 2, 2, 12, 0))
+        Ad.objects.create(brand=self.other, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 10, 0))
+
+    def test_lookups_reuse_one_build(self):
+        with self.assertNumQueries(1):
+            index = self.brand.get_spend_index()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(index.date_spend(datetime(2023, 1, 30).date()), 15)
+            self.assertEqual(index.date_spend(datetime(2023, 2, 2).date()), 12)
+            self.assertEqual(index.date_spend(datetime(2023, 3, 1).date()), 0)
+            self.assertEqual(index.month_spend('2023-01'), 39)
+            self.assertEqual(index.month_spend('2023-02'), 36)
+
+    def test_brand_lookups_reuse_one_build(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.brand.get_date_spend(datetime(2023, 1, 30).date()), 15)
+            self.assertEqual(self.brand.get_date_spend(datetime(2023, 2, 2).date()), 12)
+            self.assertEqual(self.brand.get_month_spend('2023-01'), 39)
+            self.assertEqual(self.brand.get_month_spend('2023-02'), 36)
+
+        # Rebuilt after a save, which may follow ad changes.
+        Ad.objects.filter(brand=self.brand).update(end_time=datetime(2023, 1, 30, 10, 0))
+        self.brand.save()
+        self.assertEqual(self.brand.get_month_spend('2023-02'), 0)
+
+    def test_spend_between(self):
+        index = self.brand.get_spend_index()
+
+        self.assertEqual(index.spend_between(datetime(2023, 1, 1).date(), datetime(2023, 12, 31).date()), 75)
+        self.assertEqual(index.spend_between(datetime(2023, 1, 31).date(), datetime(2023, 2, 1).date()), 48)
+        self.assertEqual(index.spend_between(datetime(2023, 2, 2).date(), datetime(2023, 2, 2).date()), 12)
+        self.assertEqual(index.spend_between(datetime(2023, 3, 1).date(), datetime(2023, 3, 31).date()), 0)
+
+    def test_indexes_for_many_brands(self):
+        empty = Brand.objects.create(name="Brand 3", daily_budget=100.00, monthly_budget=200.00)
+
+        with self.assertNumQueries(1):
+            indexes = Brand.get_spend_indexes([self.brand.pk, self.other.pk, empty.pk])
+
+        self.assertEqual(indexes[self.brand.pk].month_spend('2023-01'), 39)
+        self.assertEqual(indexes[self.other.pk].date_spend(datetime(2023, 1, 1).date()), 1)
+        self.assertEqual(indexes[empty.pk].month_spend('2023-01'), 0)
+
 class TaskAdScheduler(TestCase):
     def setUp(self):
         self.brand = Brand.objects.create(
@@ -231,6 +353,38 @@ class TaskAdScheduler(TestCase):
 
         self.assertEqual(self.ad1.active, False)
 
+    @freeze_time("2023-1-1 10:00:00")
+    def test_activate_stamps_last_active_time(self):
+        task_ad_scheduler()
+
+        self.ad1.refresh_from_db()
+
+        self.assertEqual(self.ad1.last_active_time, timezone.now())
+
+    @freeze_time("2023-1-1 10:00:00")
+    def test_scheduler_result_counts(self):
+        brand2 = Brand.objects.create(name="Brand 2", daily_budget=10.00, monthly_budget=10.00, daily_spend=10.00)
+        Ad.objects.create(active=False, brand=brand2, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        Ad.objects.create(active=True, brand=self.brand, name="Ad 3", start_time=datetime(2022, 12, 1, 9, 0), end_time=datetime(2022, 12, 1, 17, 0))
+
+        result = task_ad_scheduler()
+
+        self.assertEqual(result, {'activated': 1, 'deactivated': 1, 'budget_blocked': 1})
+
+    @freeze_time("2023-1-1 10:00:00")
+    def test_scheduler_query_count_is_constant(self):
+        for i in range(20):
+            Ad.objects.create(active=False, brand=self.brand, name=f"Ad {i}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+        # Expired brands to bump (none, so no deactivation), pending count,
+        # then the activated ads' brands bumped and the ads flipped.
+        with self.assertNumQueries(4):
+            task_ad_scheduler()
+
+        # Nothing flips on the second tick, so nothing is written.
+        with self.assertNumQueries(2):
+            task_ad_scheduler()
+
 class TaskUpdateAdSpend(TestCase):
     def setUp(self):
         self.brand = Brand.objects.create(
@@ -267,6 +421,112 @@ class TaskUpdateAdSpend(TestCase):
         spend = AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 2))
         self.assertEqual(spend.spent, 14)
 
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_spend_upserts_one_row_per_day(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 14:00:00")
+        # Active ads, existing rows, one upsert, the brand rollup and the watermarks, plus the savepoint pair.
+        with self.assertNumQueries(7):
+            task_update_adspend()
+        frozen_time.move_to("2023-1-1 15:00:00")
+        task_update_adspend()
+
+        self.assertEqual(AdSpend.objects.filter(ad=self.ad1).count(), 1)
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1).spent, 3)
+
+@override_settings(ADSPEND_ACCRUAL_MODE='incremental')
+class TaskUpdateAdSpendIncremental(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(
+            name="Brand 1", 
+            daily_budget=100.00, 
+            monthly_budget=200.00
+        )
+
+        self.ad1 = Ad.objects.create(
+            active=False, 
+            brand=self.brand, 
+            name="Ad 1", 
+            start_time=datetime(2023, 1, 1, 9, 0), 
+            end_time=datetime(2023, 1, 2, 17, 0)
+        )
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_spend_accumulates_between_ticks(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 12:20:00")
+        task_update_adspend()
+        frozen_time.move_to("2023-1-1 12:50:00")
+        task_update_adspend()
+
+        spend = AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 1))
+        self.assertEqual(spend.active_seconds, 50 * 60)
+        self.assertEqual(spend.spent, 1)
+
+        frozen_time.move_to("2023-1-1 13:10:00")
+        task_update_adspend()
+
+        spend.refresh_from_db()
+        self.assertEqual(spend.spent, 2)
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_switch_from_recompute_same_day(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 12:20:00")
+        with override_settings(ADSPEND_ACCRUAL_MODE='recompute'):
+            task_update_adspend()
+        frozen_time.move_to("2023-1-1 12:50:00")
+        task_update_adspend()
+
+        # Incremental continues from the recomputed time instead of adding it again.
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 1)).active_seconds, 50 * 60)
+        self.assertEqual(AdSpend.objects.count(), 1)
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_spend_split_across_days(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-2 14:00:00")
+        task_update_adspend()
+
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 1)).spent, 12)
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 2)).spent, 14)
+
+    @freeze_time("2023-1-1 10:00:00", as_kwarg='frozen_time')
+    def test_reactivation_keeps_earlier_intervals(self, frozen_time):
+        task_ad_scheduler()
+        frozen_time.move_to("2023-1-1 12:00:00")
+        task_update_adspend()
+
+        Ad.objects.filter(pk=self.ad1.pk).update(active=False)
+        frozen_time.move_to("2023-1-1 15:00:00")
+        Ad.objects.filter(pk=self.ad1.pk).update(active=True, last_active_time=timezone.now())
+
+        frozen_time.move_to("2023-1-1 16:00:00")
+        task_update_adspend()
+
+        spend = AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 1))
+        self.assertEqual(spend.spent, 3)
+
+    @freeze_time("2023-1-1 10:00:00", as_kwarg='frozen_time')
+    def test_query_count_is_constant(self, frozen_time):
+        for i in range(20):
+            Ad.objects.create(active=False, brand=self.brand, name=f"Ad {i}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 11:00:00")
+        # Active ads, existing rows, one upsert, the brand rollup and the
+        # watermarks, plus the savepoint pair.
+        with self.assertNumQueries(7):
+            task_update_adspend()
+
+        frozen_time.move_to("2023-1-1 12:00:00")
+        with self.assertNumQueries(7):
+            task_update_adspend()
+
 class TaskUpgradeBrandSpend(TestCase):
     def setUp(self):
         self.brand = Brand.objects.create(
@@ -330,4 +590,1035 @@ class TaskUpgradeBrandSpend(TestCase):
 
         self.brand.refresh_from_db()
         self.assertEqual(self.brand.daily_spend, 10)
-        self.assertEqual(self.brand.monthly_spend, 10)
\ No newline at end of file
+        self.assertEqual(self.brand.monthly_spend, 10)
+
+class RollupBrandSpend(TestCase):
+    def setUp(self):
+        self.brand1 = Brand.objects.create(name="Brand 1", daily_budget=10.00, monthly_budget=200.00)
+        self.brand2 = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00, daily_spend=5.00, monthly_spend=5.00)
+
+        self.ad1 = Ad.objects.create(active=True, brand=self.brand1, name="Ad 1", start_time=datetime(2023, 1, 1, 0, 0), end_time=datetime(2023, 1, 31, 0, 0))
+        self.ad2 = Ad.objects.create(active=True, brand=self.brand2, name="Ad 2", start_time=datetime(2023, 1, 1, 0, 0), end_time=datetime(2023, 1, 31, 0, 0))
+
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2023, 1, 10).date(), spent=12)
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2023, 1, 9).date(), spent=3)
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2022, 12, 31).date(), spent=50)
+
+    @freeze_time("2023-1-10 12:00:00")
+    def test_rollup_totals_and_deactivation(self):
+        result = task_update_brand_spend()
+
+        self.brand1.refresh_from_db()
+        self.brand2.refresh_from_db()
+        self.ad1.refresh_from_db()
+        self.ad2.refresh_from_db()
+
+        self.assertEqual(self.brand1.daily_spend, 12)
+        self.assertEqual(self.brand1.monthly_spend, 15)
+        self.assertEqual(self.brand2.daily_spend, 0)
+        self.assertEqual(self.brand2.monthly_spend, 0)
+        self.assertEqual(self.brand2.last_spend_update, timezone.now())
+        self.assertEqual(self.ad1.active, False)
+        self.assertEqual(self.ad2.active, True)
+        self.assertEqual(result, {'brands': 2, 'updated': 2, 'exhausted': 1, 'over_budget': 1, 'ads_deactivated': 1})
+
+    @freeze_time("2023-1-10 12:00:00")
+    def test_rollup_query_count_is_constant(self):
+        for i in range(20):
+            brand = Brand.objects.create(name=f"Brand {i}", daily_budget=100.00, monthly_budget=200.00)
+            ad = Ad.objects.create(active=True, brand=brand, name=f"Ad {i}", start_time=datetime(2023, 1, 1, 0, 0), end_time=datetime(2023, 1, 31, 0, 0))
+            AdSpend.objects.create(ad=ad, date=datetime(2023, 1, 10).date(), spent=1)
+
+        # Totals, brands, bulk update, over budget count, the deactivated ads'
+        # brands bumped and the ads flipped, plus the savepoint pair.
+        with self.assertNumQueries(8):
+            task_update_brand_spend()
+
+        # Unchanged totals skip the bulk update, and no ad is left to flip.
+        with self.assertNumQueries(6):
+            result = task_update_brand_spend()
+        self.assertEqual(result['updated'], 0)
+
+
+class BrandDailySpendTestCase(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 2, 17, 0))
+        self.ad2 = Ad.objects.create(brand=self.brand, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 2, 17, 0))
+        self.day = datetime(2023, 1, 1).date()
+
+    def stored(self):
+        return dict(BrandDailySpend.objects.filter(brand=self.brand).values_list('date', 'spent'))
+
+    def test_rollup_follows_adspend_writes(self):
+        spend = AdSpend.objects.create(ad=self.ad1, date=self.day, spent=3)
+        AdSpend.objects.create(ad=self.ad2, date=self.day, spent=2)
+        self.assertEqual(self.stored(), {self.day: 5})
+
+        spend.spent = 7
+        spend.save()
+        self.assertEqual(self.stored(), {self.day: 9})
+
+        spend.delete()
+        self.assertEqual(self.stored(), {self.day: 2})
+
+        self.ad2.delete()
+        self.assertEqual(self.stored(), {self.day: 0})
+
+    def test_rollup_follows_an_ad_to_another_brand(self):
+        other = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00)
+        AdSpend.objects.create(ad=self.ad1, date=self.day, spent=5)
+        AdSpend.objects.create(ad=self.ad2, date=self.day, spent=2)
+
+        response = self.client.patch(f'/api/ads/{self.ad1.pk}/', {'brand': other.pk}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored(), {self.day: 2})
+        self.assertEqual(dict(BrandDailySpend.objects.filter(brand=other).values_list('date', 'spent')), {self.day: 5})
+
+        self.client.delete(f'/api/ads/{self.ad1.pk}/')
+        call_command('check_brand_daily_spend', stdout=StringIO())
+        self.assertEqual(dict(BrandDailySpend.objects.filter(brand=other).values_list('date', 'spent')), {self.day: 0})
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_rollup_follows_accrual(self, frozen_time):
+        task_ad_scheduler()
+        frozen_time.move_to("2023-1-1 14:00:00")
+        task_update_adspend()
+        frozen_time.move_to("2023-1-1 15:00:00")
+        task_update_adspend()
+
+        self.assertEqual(self.stored(), {self.day: 6})
+
+    def test_check_and_rebuild(self):
+        AdSpend.objects.create(ad=self.ad1, date=self.day, spent=3)
+        BrandDailySpend.objects.filter(brand=self.brand).update(spent=10)
+
+        with self.assertRaises(CommandError):
+            call_command('check_brand_daily_spend', stdout=StringIO())
+
+        call_command('check_brand_daily_spend', '--fix', stdout=StringIO())
+        self.assertEqual(self.stored(), {self.day: 3})
+
+        BrandDailySpend.objects.all().delete()
+        call_command('rebuild_brand_daily_spend', stdout=StringIO())
+        self.assertEqual(self.stored(), {self.day: 3})
+
+
+@override_settings(BUDGET_COUNTER_BACKEND='api.budget.InMemoryBudgetCounters')
+class LiveBudgetCounters(TestCase):
+    def setUp(self):
+        self.counters = get_budget_counters()
+        self.counters.clear()
+
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=2.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(active=False, brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 2, 17, 0))
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_exhausted_budget_stops_ads_on_accrual(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 14:00:00")
+        with self.captureOnCommitCallbacks(execute=True):
+            result = accrue_ad_spend(timezone.now())
+
+        self.ad1.refresh_from_db()
+        self.assertEqual(result.budgets_exhausted, 1)
+        self.assertEqual(self.ad1.active, False)
+        self.assertEqual(self.counters.exhausted_brand_ids(timezone.now().date()), {self.brand.pk})
+
+        # The brand row was never rolled up, only the counters block activation.
+        self.assertEqual(task_ad_scheduler()['budget_blocked'], 1)
+
+        self.brand.daily_budget = 10
+        self.brand.save()
+        self.assertEqual(task_ad_scheduler()['activated'], 1)
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_shard_feeds_counters_after_commit(self, frozen_time):
+        task_ad_scheduler()
+
+        frozen_time.move_to("2023-1-1 14:00:00")
+        with self.captureOnCommitCallbacks() as callbacks:
+            process_brand_shard(self.brand.pk, self.brand.pk)
+        self.assertEqual(self.counters.spend_totals(timezone.now().date()), {})
+
+        for callback in callbacks:
+            callback()
+        self.ad1.refresh_from_db()
+        self.assertEqual(self.ad1.active, False)
+        self.assertEqual(self.counters.exhausted_brand_ids(timezone.now().date()), {self.brand.pk})
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_sync_primes_then_flushes(self, frozen_time):
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2023, 1, 1).date(), spent=1)
+        task_sync_budget_counters()
+        self.assertEqual(self.counters.spend_totals(timezone.now().date()), {self.brand.pk: (1, 1)})
+
+        task_ad_scheduler()
+        frozen_time.move_to("2023-1-1 14:00:00")
+        with self.captureOnCommitCallbacks(execute=True):
+            task_update_adspend()
+
+        self.assertEqual(task_sync_budget_counters(), 1)
+        self.brand.refresh_from_db()
+        self.assertEqual(self.brand.daily_spend, 2)
+        self.assertEqual(self.brand.monthly_spend, 2)
+
+
+class AdTimeline(TestCase):
+    def setUp(self):
+        cache.delete(PLANNED_UNTIL_KEY)
+
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(active=False, brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        self.ad2 = Ad.objects.create(active=False, brand=self.brand, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 2, 3, 0))
+
+    def test_next_transitions(self):
+        start = timezone.make_aware(datetime(2023, 1, 1, 8, 0))
+        plan = next_transitions(start, start + timedelta(days=1))
+
+        self.assertEqual(plan, [
+            (timezone.make_aware(datetime(2023, 1, 1, 9, 0)), [self.ad1.pk, self.ad2.pk]),
+            (timezone.make_aware(datetime(2023, 1, 1, 17, 0, 1)), [self.ad1.pk]),
+            (timezone.make_aware(datetime(2023, 1, 2, 0, 0, 5)), None),
+            (timezone.make_aware(datetime(2023, 1, 2, 3, 0, 1)), [self.ad2.pk]),
+        ])
+
+    @freeze_time("2023-1-1 08:00:00", as_kwarg='frozen_time')
+    def test_plan_timeline_dispatches_eta_tasks(self, frozen_time):
+        with patch.object(task_apply_transitions, 'apply_async') as apply_async, patch.object(task_apply_transitions, 'delay') as delay:
+            self.assertEqual(plan_timeline(horizon=3600), 1)
+            # Nothing planned before, so the current state is applied first.
+            delay.assert_called_once_with()
+            apply_async.assert_called_once_with(kwargs={'ad_ids': [self.ad1.pk, self.ad2.pk]}, eta=timezone.make_aware(datetime(2023, 1, 1, 9, 0)))
+
+            # The next run, one horizon later, only plans past what is already planned.
+            delay.reset_mock()
+            apply_async.reset_mock()
+            frozen_time.move_to("2023-1-1 09:00:00")
+            self.assertEqual(plan_timeline(horizon=3600), 0)
+            delay.assert_not_called()
+            apply_async.assert_not_called()
+
+            # After a missed period the current state is applied again.
+            frozen_time.move_to("2023-1-1 16:00:00")
+            self.assertEqual(plan_timeline(horizon=3600), 1)
+            delay.assert_called_once_with()
+            apply_async.assert_called_once_with(kwargs={'ad_ids': [self.ad1.pk]}, eta=timezone.make_aware(datetime(2023, 1, 1, 17, 0, 1)))
+
+    @freeze_time("2023-1-1 10:00:00")
+    def test_apply_transitions_only_touches_given_ads(self):
+        result = task_apply_transitions(ad_ids=[self.ad1.pk])
+
+        self.ad1.refresh_from_db()
+        self.ad2.refresh_from_db()
+        self.assertEqual(result['activated'], 1)
+        self.assertEqual(self.ad1.active, True)
+        self.assertEqual(self.ad2.active, False)
+
+    @override_settings(AD_TIMELINE_ENABLED=True)
+    @freeze_time("2023-1-1 08:00:00")
+    def test_edited_ad_is_replanned(self):
+        cache.set(PLANNED_UNTIL_KEY, timezone.now() + timedelta(hours=2), None)
+
+        with patch.object(task_apply_transitions, 'apply_async') as apply_async, patch.object(task_apply_transitions, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ad1.start_time = timezone.make_aware(datetime(2023, 1, 1, 8, 30))
+                self.ad1.save()
+
+            delay.assert_called_once_with(ad_ids=[self.ad1.pk])
+            apply_async.assert_called_once_with(kwargs={'ad_ids': [self.ad1.pk]}, eta=timezone.make_aware(datetime(2023, 1, 1, 8, 30)))
+
+
+class BrandSharding(TestCase):
+    def setUp(self):
+        self.brands = [
+            Brand.objects.create(name=f"Brand {i}", daily_budget=100.00, monthly_budget=200.00)
+            for i in range(5)
+        ]
+        for brand in self.brands:
+            Ad.objects.create(active=False, brand=brand, name=f"{brand.name} Ad", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def test_brand_shards(self):
+        ids = [brand.pk for brand in self.brands]
+        self.assertEqual(brand_shards(2), [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])])
+
+    @freeze_time("2023-1-1 10:00:00", as_kwarg='frozen_time')
+    def test_process_brand_shard(self, frozen_time):
+        first, last = self.brands[0].pk, self.brands[1].pk
+        result = process_brand_shard(first, last)
+
+        self.assertEqual(result['brands_locked'], 2)
+        self.assertEqual(result['brands_skipped'], 0)
+        self.assertEqual(result['scheduler_activated'], 2)
+        self.assertEqual(Ad.objects.filter(active=True).count(), 2)
+
+        frozen_time.move_to("2023-1-1 12:00:00")
+        result = process_brand_shard(first, last)
+        self.assertEqual(result['adspend_written'], 2)
+        self.assertEqual(result['brand_spend_updated'], 2)
+
+    @freeze_time("2023-1-1 10:00:00")
+    def test_fanout_merges_shard_results(self):
+        app = task_fanout_brands.app
+        app.conf.task_always_eager = True
+        try:
+            self.assertEqual(task_fanout_brands(shard_size=2), 3)
+        finally:
+            app.conf.task_always_eager = False
+
+        self.assertEqual(Ad.objects.filter(active=True).count(), 5)
+        self.assertEqual(
+            merge_shard_results([{'brands_locked': 2, 'scheduler_activated': 2}, {'brands_locked': 1, 'scheduler_activated': 1}]),
+            {'shards': 2, 'brands_locked': 3, 'scheduler_activated': 3},
+        )
+
+
+class TickGuard(TestCase):
+    def setUp(self):
+        self.store = get_tick_store()
+        self.store.clear()
+
+    def test_skips_while_previous_run_holds_the_lock(self):
+        token = self.store.acquire('ad_scheduler', 60)
+        self.assertIsNone(self.store.acquire('ad_scheduler', 60))
+
+        self.assertIsNone(task_ad_scheduler())
+        self.assertEqual(self.store.stats()['ad_scheduler']['skipped'], 1)
+
+        self.store.release('ad_scheduler', token)
+        self.assertEqual(task_ad_scheduler()['activated'], 0)
+        self.assertEqual(self.store.stats()['ad_scheduler']['runs'], 1)
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_records_lag_and_serves_stats(self, frozen_time):
+        task_update_brand_spend()
+        frozen_time.tick(25)
+        task_update_brand_spend()
+
+        stats = self.client.get('/api/ticks/').json()['update_brand_spend']
+        self.assertEqual(stats['runs'], 2)
+        self.assertEqual(stats['skipped'], 0)
+        self.assertEqual(stats['last_lag'], 15)
+        self.assertEqual(stats['max_lag'], 15)
+
+
+class ListEndpoints(TestCase):
+    def setUp(self):
+        for i in range(3):
+            brand = Brand.objects.create(name=f"Brand {i}", daily_budget=100.00, monthly_budget=200.00)
+            for j in range(3):
+                Ad.objects.create(brand=brand, name=f"Ad {i}.{j}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def assertListQueries(self, url, num):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for url, num in (('/api/brands/', 1), ('/api/brands/?expand=ads', 2), ('/api/ads/', 1), ('/api/settings/', 1)):
+            self.assertListQueries(url, num)
+
+        brand = Brand.objects.create(name="Brand 4", daily_budget=100.00, monthly_budget=200.00)
+        Ad.objects.create(brand=brand, name="Ad 4", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        self.assertListQueries('/api/brands/?expand=ads', 2)
+
+    def test_ads_are_embedded_on_demand(self):
+        page = self.assertListQueries('/api/brands/', 1)
+        self.assertNotIn('ads', page['results'][0])
+
+        page = self.assertListQueries('/api/brands/?expand=ads&ads_limit=2', 2)
+        self.assertEqual([len(brand['ads']) for brand in page['results']], [2, 2, 2])
+        self.assertEqual(self.client.get('/api/brands/?expand=ads&ads_limit=0').status_code, 400)
+
+    def test_cursor_pagination(self):
+        page = self.client.get('/api/ads/?page_size=5').json()
+        self.assertEqual(len(page['results']), 5)
+        self.assertIsNone(page['previous'])
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertIsNone(page['next'])
+
+
+class BrandSpendEndpoints(TestCase):
+    def setUp(self):
+        self.brand1 = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.brand2 = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00)
+        for brand in (self.brand1, self.brand2):
+            for i in range(2):
+                ad = Ad.objects.create(brand=brand, name=f"{brand.name} Ad {i}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 3, 1, 17, 0))
+                for day in (datetime(2023, 1, 30), datetime(2023, 1, 31), datetime(2023, 2, 1)):
+                    AdSpend.objects.create(ad=ad, date=day.date(), spent=1.5)
+
+    def test_brand_spend_by_day_and_month(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/brands/{self.brand1.pk}/spend/')
+        self.assertEqual(response.json(), {
+            'brand': self.brand1.pk,
+            'granularity': 'day',
+            'spend': [
+                {'period': '2023-01-30', 'spent': '3.00'},
+                {'period': '2023-01-31', 'spent': '3.00'},
+                {'period': '2023-02-01', 'spent': '3.00'},
+            ],
+        })
+
+        response = self.client.get(f'/api/brands/{self.brand1.pk}/spend/?granularity=month&from=2023-01-31')
+        self.assertEqual(response.json()['spend'], [
+            {'period': '2023-01', 'spent': '3.00'},
+            {'period': '2023-02', 'spent': '3.00'},
+        ])
+
+    def test_invalid_queries(self):
+        url = f'/api/brands/{self.brand1.pk}/spend/'
+        self.assertEqual(self.client.get(f'{url}?granularity=week').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?from=2023-02-01&to=2023-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/brands/0/spend/').status_code, 404)
+        self.assertEqual(self.client.get('/api/brands/spend/').status_code, 400)
+
+    def test_bulk_spend(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/brands/spend/?brand={self.brand1.pk}&brand={self.brand2.pk}&brand=999&granularity=month&to=2023-01-31')
+        self.assertEqual(response.json(), [
+            {'brand': self.brand1.pk, 'granularity': 'month', 'spend': [{'period': '2023-01', 'spent': '6.00'}]},
+            {'brand': self.brand2.pk, 'granularity': 'month', 'spend': [{'period': '2023-01', 'spent': '6.00'}]},
+        ])
+
+
+class SpendExport(TestCase):
+    def setUp(self):
+        self.brand1 = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.brand2 = Brand.objects.create(name="Brand, Two", daily_budget=100.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(brand=self.brand1, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 3, 1, 17, 0))
+        self.ad2 = Ad.objects.create(brand=self.brand2, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 3, 1, 17, 0))
+        for ad in (self.ad1, self.ad2):
+            AdSpend.objects.create(ad=ad, date=datetime(2023, 1, 1).date(), spent=1.5)
+            AdSpend.objects.create(ad=ad, date=datetime(2023, 1, 2).date(), spent=2)
+
+    def test_streams_adspend_csv(self):
+        response = self.client.get('/api/exports/adspend/?from=2023-01-02')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            'date,brand_id,brand_name,ad_id,ad_name,spent',
+            f'2023-01-02,{self.brand1.pk},Brand 1,{self.ad1.pk},Ad 1,2.00',
+            f'2023-01-02,{self.brand2.pk},"Brand, Two",{self.ad2.pk},Ad 2,2.00',
+        ])
+
+    def test_streams_brand_spend_ndjson(self):
+        response = self.client.get(f'/api/exports/brand-spend/?output=ndjson&brand={self.brand2.pk}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            f'{{"date": "2023-01-01", "brand_id": {self.brand2.pk}, "brand_name": "Brand, Two", "spent": "1.50"}}',
+            f'{{"date": "2023-01-02", "brand_id": {self.brand2.pk}, "brand_name": "Brand, Two", "spent": "2.00"}}',
+        ])
+        self.assertEqual(self.client.get('/api/exports/adspend/?output=xml').status_code, 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_spend', 'brand-spend', '--to', '2023-01-01', '--chunk-size', '1', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'date,brand_id,brand_name,spent',
+            f'2023-01-01,{self.brand1.pk},Brand 1,1.50',
+            f'2023-01-01,{self.brand2.pk},"Brand, Two",1.50',
+        ])
+
+        with self.assertRaises(CommandError):
+            call_command('export_spend', 'adspend', '--from', 'yesterday', stdout=StringIO())
+
+
+class BulkAds(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(active=True, brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        self.ad2 = Ad.objects.create(active=False, paused=True, brand=self.brand, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def post(self, payload):
+        return self.client.post('/api/ads/bulk/', payload, content_type='application/json')
+
+    @freeze_time("2023-1-1 12:00:00")
+    def test_create_update_pause_resume(self):
+        creates = [
+            {'name': f"New {i}", 'brand': self.brand.pk, 'start_time': '2023-01-02T09:00:00Z', 'end_time': '2023-01-02T17:00:00Z'}
+            for i in range(20)
+        ]
+        with self.assertNumQueries(15):
+            response = self.post({
+                'create': creates,
+                'update': [{'id': self.ad1.pk, 'name': "Renamed"}],
+                'pause': [self.ad1.pk],
+                'resume': [self.ad2.pk],
+            })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        self.assertEqual([ad['name'] for ad in body['create']], [f"New {i}" for i in range(20)])
+        self.assertEqual(body['update'][0]['name'], "Renamed")
+        self.assertEqual((body['pause'][0]['paused'], body['pause'][0]['active']), (True, False))
+        self.assertEqual((body['resume'][0]['paused'], body['resume'][0]['active']), (False, True))
+        self.assertEqual(Ad.objects.count(), 22)
+
+        # The scheduler leaves paused ads alone.
+        self.assertEqual(task_ad_scheduler()['activated'], 0)
+
+    def test_invalid_items_write_nothing(self):
+        response = self.post({
+            'create': [
+                {'name': "Ok", 'brand': self.brand.pk, 'start_time': '2023-01-02T09:00:00Z', 'end_time': '2023-01-02T17:00:00Z'},
+                {'name': "Bad brand", 'brand': 999, 'start_time': '2023-01-02T09:00:00Z', 'end_time': '2023-01-02T17:00:00Z'},
+                {'brand': self.brand.pk},
+            ],
+            'update': [{'name': "No id"}],
+            'pause': [999],
+        })
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+
+        self.assertEqual(errors['create'][0], {})
+        self.assertIn('brand', errors['create'][1])
+        self.assertEqual(set(errors['create'][2]), {'name', 'start_time', 'end_time'})
+        self.assertIn('id', errors['update'][0])
+        self.assertEqual(errors['pause'], [{'id': ['Ad not found.']}])
+        self.assertEqual(Ad.objects.count(), 2)
+
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({'pause': [self.ad1.pk], 'resume': [self.ad1.pk]}).status_code, 400)
+
+    def test_moving_ads_moves_their_spend(self):
+        other = Brand.objects.create(name="Brand 2", daily_budget=100.00, monthly_budget=200.00)
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2023, 1, 1).date(), spent=5)
+        version = Brand.objects.get(pk=other.pk).version
+
+        response = self.post({'update': [{'id': self.ad1.pk, 'brand': other.pk}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BrandDailySpend.objects.get(brand=other).spent, 5)
+        self.assertEqual(BrandDailySpend.objects.get(brand=self.brand).spent, 0)
+        self.assertGreater(Brand.objects.get(pk=other.pk).version, version)
+        call_command('check_brand_daily_spend', stdout=StringIO())
+
+    def test_benchmark_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_ad_writes', '--ads', '20', stdout=out)
+
+        self.assertEqual([line.split(':')[0] for line in out.getvalue().splitlines()], ['single', 'bulk'])
+        self.assertEqual(Ad.objects.count(), 2)
+
+
+class AdSpendIngest(TestCase):
+    def setUp(self):
+        self.brand1 = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.brand2 = Brand.objects.create(name="Brand 2", daily_budget=5.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(brand=self.brand1, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 31, 17, 0))
+        self.ad2 = Ad.objects.create(active=True, brand=self.brand2, name="Ad 2", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 31, 17, 0))
+        AdSpend.objects.create(ad=self.ad1, date=datetime(2023, 1, 2).date(), spent=3)
+
+    def rollup(self, brand):
+        return dict(BrandDailySpend.objects.filter(brand=brand).values_list('date', 'spent'))
+
+    @freeze_time("2023-1-3 12:00:00")
+    def test_ingest_csv_endpoint(self):
+        body = "\n".join([
+            "ad_id,date,spent",
+            f"{self.ad1.pk},2023-01-02,1.25",
+            f"{self.ad1.pk},2023-01-03,4",
+            f"{self.ad2.pk},2023-01-03,6.50",
+            f"{self.ad2.pk},2023-01-03,oops",
+            "999,2023-01-03,1",
+            f"{self.ad1.pk},2023-01-03,4.001",
+        ])
+        response = self.client.post('/api/ingest/adspend/?chunk_size=2', body, content_type='text/csv')
+        result = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((result['rows'], result['written'], result['rejected'], result['brands']), (6, 3, 3, 2))
+        self.assertEqual(sorted(error['line'] for error in result['errors']), [5, 6, 7])
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=datetime(2023, 1, 2).date()).spent, Decimal('1.25'))
+        self.assertEqual(self.rollup(self.brand1), {datetime(2023, 1, 2).date(): Decimal('1.25'), datetime(2023, 1, 3).date(): 4})
+
+        # Only touched brands are rolled up; Brand 2 went over its daily budget.
+        self.brand2.refresh_from_db()
+        self.ad2.refresh_from_db()
+        self.assertEqual(self.brand2.daily_spend, Decimal('6.50'))
+        self.assertEqual(result['ads_deactivated'], 1)
+        self.assertEqual(self.ad2.active, False)
+
+    @freeze_time("2023-1-3 12:00:00", as_kwarg='frozen_time')
+    def test_accrual_keeps_reported_spend(self, frozen_time):
+        Ad.objects.filter(pk=self.ad1.pk).update(active=True, last_active_time=timezone.make_aware(datetime(2023, 1, 3, 10, 0)))
+        today = datetime(2023, 1, 3).date()
+        task_update_adspend()
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=today).spent, 2)
+
+        self.client.post('/api/ingest/adspend/', f"ad_id,date,spent\n{self.ad1.pk},2023-01-03,1.50", content_type='text/csv')
+        for mode in ('recompute', 'incremental'):
+            frozen_time.tick(timedelta(hours=2))
+            with override_settings(ADSPEND_ACCRUAL_MODE=mode):
+                task_update_adspend()
+
+        self.assertEqual(AdSpend.objects.get(ad=self.ad1, date=today).spent, Decimal('1.50'))
+        self.assertEqual(self.rollup(self.brand1)[today], Decimal('1.50'))
+        call_command('check_brand_daily_spend', stdout=StringIO())
+
+    def test_ingest_ndjson_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as report:
+            report.write(f'{{"ad_id": {self.ad1.pk}, "date": "2023-01-02", "spent": "2.5"}}\n\nnot json\n')
+            report.flush()
+            out, err = StringIO(), StringIO()
+            call_command('ingest_adspend', report.name, stdout=out, stderr=err)
+
+        self.assertIn("1 written, 1 rejected", out.getvalue())
+        self.assertIn("Line 3: Not a JSON object.", err.getvalue())
+        self.assertEqual(self.rollup(self.brand1), {datetime(2023, 1, 2).date(): Decimal('2.50')})
+
+
+class HourlyRates(TestCase):
+    def setUp(self):
+        invalidate_rates()
+        self.addCleanup(invalidate_rates)
+
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(active=False, brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 3, 17, 0))
+
+    @freeze_time("2023-1-1 12:00:00", as_kwarg='frozen_time')
+    def test_spend_is_priced_at_the_rate_of_its_day(self, frozen_time):
+        task_ad_scheduler()
+        frozen_time.move_to("2023-1-1 13:30:00")
+        task_update_adspend()
+
+        frozen_time.move_to("2023-1-2 10:00:00")
+        with self.captureOnCommitCallbacks(execute=True):
+            Settings(hourly_rate=2.50).save()
+        task_ad_scheduler()
+        frozen_time.move_to("2023-1-2 11:30:00")
+        task_update_adspend()
+
+        spend = dict(AdSpend.objects.filter(ad=self.ad1).values_list('date', 'spent'))
+        self.assertEqual(spend, {datetime(2023, 1, 1).date(): Decimal('2.00'), datetime(2023, 1, 2).date(): Decimal('30.00')})
+
+    def test_rates_are_cached(self):
+        rate_table()
+        with self.assertNumQueries(0):
+            self.assertEqual(rate_table().on(datetime(2023, 1, 1).date()), Decimal('1.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HourlyRate.objects.create(effective_date=datetime(2023, 1, 2).date(), rate=3)
+        with self.assertNumQueries(1):
+            self.assertEqual(rate_table().on(datetime(2023, 1, 1).date()), Decimal('1.00'))
+            self.assertEqual(rate_table().on(datetime(2023, 1, 5).date()), Decimal('3.00'))
+
+
+class BrandStateCache(TestCase):
+    def setUp(self):
+        local_states.clear()
+        cache.clear()
+
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=2.00, monthly_budget=200.00)
+        self.ad1 = Ad.objects.create(active=True, brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def test_budget_endpoint_is_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/api/brands/{self.brand.pk}/budget/').json(), {
+                'brand': self.brand.pk, 'daily_budget': '2.00', 'monthly_budget': '200.00',
+                'daily_spend': '0.00', 'monthly_spend': '0.00', 'has_budget': True,
+            })
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/brands/{self.brand.pk}/budget/')
+
+        # A process with an empty local cache still hits the shared one, only
+        # the unknown brand goes to the database.
+        local_states.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/brands/budget/?brand={self.brand.pk}&brand=999')
+        self.assertEqual([state['brand'] for state in response.json()], [self.brand.pk])
+        self.assertEqual(self.client.get('/api/brands/999/budget/').status_code, 404)
+
+    @freeze_time("2023-1-1 12:00:00")
+    def test_rollup_and_save_invalidate(self):
+        self.assertEqual(get_brand_state(self.brand.pk).has_budget, True)
+
+        AdSpend.objects.create(ad=self.ad1, date=timezone.now().date(), spent=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            task_update_brand_spend()
+        self.assertEqual(get_brand_state(self.brand.pk).has_budget, False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.daily_budget = 10
+            self.brand.save()
+        self.assertEqual(get_brand_state(self.brand.pk).as_dict()['daily_budget'], 10)
+
+
+class TaskMetrics(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @freeze_time("2023-1-1 12:00:00")
+    def test_tasks_record_metrics(self):
+        brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        Ad.objects.create(active=False, brand=brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+        runs = self.sample('admanager_task_runs_total', task='ad_scheduler', outcome='ok')
+        activated = self.sample('admanager_task_rows_total', task='ad_scheduler', result='activated')
+        queries = self.sample('admanager_task_queries_sum', task='ad_scheduler')
+
+        task_ad_scheduler()
+
+        self.assertEqual(self.sample('admanager_task_runs_total', task='ad_scheduler', outcome='ok'), runs + 1)
+        self.assertEqual(self.sample('admanager_task_rows_total', task='ad_scheduler', result='activated'), activated + 1)
+        self.assertEqual(self.sample('admanager_task_queries_sum', task='ad_scheduler'), queries + 4)
+
+        task_update_brand_spend()
+        self.assertEqual(self.sample('admanager_brands_over_budget'), 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'admanager_task_duration_seconds_bucket{le="0.01",task="ad_scheduler"}', response.content)
+
+
+class BenchmarkSuite(TestCase):
+    def test_benchmark_smoke(self):
+        out = StringIO()
+        call_command('benchmark', '--brands', '3', '--ads-per-brand', '2', '--days', '2', '--repeat', '1', '--json', stdout=out)
+
+        results = {result['name']: result for result in map(json.loads, out.getvalue().splitlines())}
+        self.assertGreater(results['task.scheduler']['queries'], 0)
+        self.assertEqual(results['api.export.brand_spend']['brand_daily_spend'], 6)
+        # Served from the brand state cache after the timed runs.
+        self.assertEqual(results['api.brand_budget']['queries'], 0)
+        self.assertEqual(Brand.objects.count(), 0)
+
+
+class AsyncReadEndpoints(TestCase):
+    def setUp(self):
+        for i in range(3):
+            brand = Brand.objects.create(name=f"Brand {i}", daily_budget=100.00, monthly_budget=200.00)
+            for j in range(3):
+                ad = Ad.objects.create(brand=brand, name=f"Ad {i}.{j}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+                AdSpend.objects.create(ad=ad, date=datetime(2023, 1, 1).date(), spent=1.5)
+        self.brand = Brand.objects.order_by('pk').first()
+
+    async def test_same_responses_as_the_sync_endpoints(self):
+        ad = await Ad.objects.order_by('pk').afirst()
+        for path in (
+            'brands/',
+            'brands/?expand=ads&ads_limit=2',
+            f'brands/{self.brand.pk}/',
+            f'brands/{self.brand.pk}/spend/?granularity=month',
+            f'brands/spend/?brand={self.brand.pk}&brand=999999',
+            'ads/?page_size=4',
+            f'ads/{ad.pk}/',
+            'ads/?fields=active,brand&page_size=4',
+            'brands/?expand=ads&fields=name,ads.id&ads_limit=2',
+        ):
+            expected = await self.async_client.get(f'/api/{path}')
+            response = await self.async_client.get(f'/api/async/{path}')
+            self.assertEqual(response.status_code, 200, path)
+            # Only the pagination links differ, by their prefix.
+            self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content, path)
+
+    async def test_cursor_pagination(self):
+        page = (await self.async_client.get('/api/async/ads/?page_size=5')).json()
+        self.assertEqual(len(page['results']), 5)
+        self.assertIsNone(page['previous'])
+
+        page = (await self.async_client.get(page['next'])).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertIsNone(page['next'])
+        previous = (await self.async_client.get(page['previous'])).json()
+        self.assertEqual(len(previous['results']), 5)
+
+    async def test_errors(self):
+        response = await self.async_client.get('/api/async/brands/0/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'No Brand matches the given query.'})
+        response = await self.async_client.get('/api/async/brands/?expand=ads&ads_limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ads_limit', response.json())
+        response = await self.async_client.get(f'/api/async/brands/{self.brand.pk}/spend/?granularity=week')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await self.async_client.post('/api/async/brands/')).status_code, 405)
+
+
+class LoadTest(LiveServerTestCase):
+    def test_run_load(self):
+        Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        result = asyncio.run(run_load(self.live_server_url, ['/api/brands/', '/api/async/brands/', '/missing/'], 9, 3))
+        self.assertEqual((result.requests, result.errors), (9, 3))
+        self.assertGreater(result.throughput, 0)
+        self.assertLessEqual(result.p50, result.p99)
+
+
+class ConditionalReads(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.brands = [Brand.objects.create(name=f"Brand {i}", daily_budget=100.00, monthly_budget=200.00) for i in range(2)]
+        self.ads = [
+            Ad.objects.create(brand=brand, name=f"Ad {brand.pk}.{j}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+            for brand in self.brands
+            for j in range(2)
+        ]
+
+    def get(self, url, etag=None, **headers):
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(url, **headers)
+
+    def test_unchanged_list_is_not_modified(self):
+        for url in ('/api/brands/', '/api/brands/?expand=ads', '/api/ads/'):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            # Only the page is read: no prefetch, no serialization.
+            with self.assertNumQueries(1):
+                response = self.get(url, response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+
+    def test_saving_one_brand_twice_changes_the_etag_each_time(self):
+        url = f'/api/brands/{self.brands[0].pk}/'
+        etag = self.get(url)['ETag']
+        brand = Brand.objects.get(pk=self.brands[0].pk)
+        for name in ("First", "Second"):
+            brand.name = name
+            brand.save()
+            response = self.get(url, etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+        # A stale copy saved after it still moves the version on.
+        version = Brand.objects.get(pk=brand.pk).version
+        self.brands[0].name = "Stale"
+        self.brands[0].save()
+        self.assertEqual(Brand.objects.get(pk=brand.pk).version, version + 1)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        etags = {url: self.get(url)['ETag'] for url in ('/api/brands/?expand=ads', '/api/ads/', f'/api/brands/{self.brands[1].pk}/')}
+
+        self.ads[0].name = "Renamed"
+        self.ads[0].save()
+        self.assertEqual(self.get('/api/brands/?expand=ads', etags['/api/brands/?expand=ads']).status_code, 200)
+        self.assertEqual(self.get('/api/ads/', etags['/api/ads/']).status_code, 200)
+        # Other brands keep their version.
+        self.assertEqual(self.get(f'/api/brands/{self.brands[1].pk}/', etags[f'/api/brands/{self.brands[1].pk}/']).status_code, 304)
+
+        etag = self.get('/api/ads/')['ETag']
+        with freeze_time("2023-1-1 10:00:00"):
+            schedule_ads()
+        self.assertEqual(self.get('/api/ads/', etag).status_code, 200)
+
+        # The rollup stamps only brands whose spend moved.
+        etag = self.get('/api/brands/')['ETag']
+        task_update_brand_spend()
+        self.assertEqual(self.get('/api/brands/', etag).status_code, 304)
+        AdSpend.objects.create(ad=self.ads[0], date=timezone.now().date(), spent=1)
+        task_update_brand_spend()
+        self.assertEqual(self.get('/api/brands/', etag).status_code, 200)
+
+    def test_moving_an_ad_bumps_both_brands(self):
+        versions = dict(Brand.objects.values_list('pk', 'version'))
+        self.ads[0].brand = self.brands[1]
+        self.ads[0].save()
+        for brand_id, version in Brand.objects.values_list('pk', 'version'):
+            self.assertGreater(version, versions[brand_id])
+
+    def test_detail_last_modified(self):
+        url = f'/api/brands/{self.brands[0].pk}/'
+        response = self.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(f'/api/ads/{self.ads[0].pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertNotIn('Last-Modified', self.get('/api/brands/'))
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_response_cache(self):
+        url = '/api/brands/?expand=ads'
+        first = self.get(url)
+        # Every brand is cached, so the ads aren't even fetched.
+        with self.assertNumQueries(1):
+            second = self.get(url)
+        self.assertEqual(second.content, first.content)
+
+        self.ads[0].name = "Renamed"
+        self.ads[0].save()
+        # Only the changed brand's ads are prefetched and serialized again.
+        with patch('api.serializers.BrandWithAdsSerializer.to_representation', autospec=True, side_effect=lambda self, obj: {'id': obj.pk}) as to_representation:
+            third = self.get(url)
+        self.assertEqual([call.args[1].pk for call in to_representation.call_args_list], [self.brands[0].pk])
+        self.assertEqual(third.json()['results'][1], first.json()['results'][1])
+
+
+@override_settings(EVENT_LOG_BACKEND='api.events.InMemoryEventLog')
+class ChangeFeed(TestCase):
+    def setUp(self):
+        self.log = get_event_log()
+        self.log.clear()
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=1.00, monthly_budget=200.00)
+        self.ad = Ad.objects.create(brand=self.brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def events(self, after='0-0'):
+        return self.client.get(f'/api/events/?after={after}').json()
+
+    @freeze_time("2023-1-1 10:00:00", as_kwarg='frozen_time')
+    def test_tasks_publish_events(self, frozen_time):
+        start = self.client.get('/api/events/').json()
+        self.assertEqual(start, {'events': [], 'cursor': '0-0', 'truncated': False})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task_ad_scheduler()
+        frozen_time.move_to("2023-1-1 12:00:00")
+        with self.captureOnCommitCallbacks(execute=True):
+            task_update_adspend()
+            task_update_brand_spend()
+
+        feed = self.events(start['cursor'])
+        self.assertEqual(
+            [(event['type'], event.get('ad'), event['brand'], event.get('reason')) for event in feed['events']],
+            [
+                ('ad.activated', self.ad.pk, self.brand.pk, 'schedule'),
+                ('brand.budget_exhausted', None, self.brand.pk, None),
+                ('ad.deactivated', self.ad.pk, self.brand.pk, 'budget'),
+            ],
+        )
+        self.assertEqual(feed['cursor'], feed['events'][-1]['id'])
+        self.assertEqual(self.events(feed['cursor'])['events'], [])
+
+    def test_rolled_back_changes_are_not_published(self):
+        with freeze_time("2023-1-1 10:00:00"):
+            task_ad_scheduler()
+        self.assertEqual(self.events()['events'], [])
+
+    def test_truncation(self):
+        log = InMemoryEventLog(maxlen=2)
+        ids = log.append([{'type': 'ad.activated', 'ad': ad_id} for ad_id in range(3)])
+        self.assertEqual(log.read('0-0', 10), ([(ids[1], {'type': 'ad.activated', 'ad': 1}), (ids[2], {'type': 'ad.activated', 'ad': 2})], True))
+        self.assertEqual(log.read(ids[0], 10)[1], False)
+
+        maxlen = self.log.maxlen
+        self.addCleanup(setattr, self.log, 'maxlen', maxlen)
+        self.log.maxlen = 1
+        self.log.append([{'type': 'ad.activated', 'ad': ad_id} for ad_id in range(3)])
+        # Everything after the cursor is gone: the client reloads and continues at the end.
+        self.assertEqual(self.events(), {'events': [{'id': '3-0', 'type': 'ad.activated', 'ad': 2}], 'cursor': '3-0', 'truncated': True})
+        self.assertEqual(self.events('3-0'), {'events': [], 'cursor': '3-0', 'truncated': False})
+
+    async def test_long_poll_waits_for_the_next_event(self):
+        cursor = (await self.async_client.get('/api/events/')).json()['cursor']
+        request = asyncio.ensure_future(self.async_client.get(f'/api/events/?after={cursor}&wait=5'))
+        await asyncio.sleep(0.1)
+        self.assertFalse(request.done())
+        self.log.append([{'type': 'ad.activated', 'ad': 1, 'brand': 1}])
+        feed = (await request).json()
+        self.assertEqual([event['ad'] for event in feed['events']], [1])
+
+        feed = (await self.async_client.get(f'/api/events/?after={feed["cursor"]}&wait=0.1')).json()
+        self.assertEqual(feed['events'], [])
+
+    async def test_server_sent_events(self):
+        self.log.append([{'type': 'ad.activated', 'ad': ad_id, 'brand': 1} for ad_id in (1, 2)])
+        response = await self.async_client.get('/api/events/', headers={'Accept': 'text/event-stream', 'Last-Event-ID': '1-0'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunk = await anext(aiter(response.streaming_content))
+        self.assertEqual(chunk, b'id: 2-0\nevent: ad.activated\ndata: {"type":"ad.activated","ad":2,"brand":1}\n\n')
+
+    def test_no_server_sent_events_under_wsgi(self):
+        self.log.append([{'type': 'ad.activated', 'ad': 1, 'brand': 1}])
+        response = self.client.get('/api/events/', headers={'Accept': 'text/event-stream', 'Last-Event-ID': '0-0'})
+        self.assertEqual(response.status_code, 406)
+        self.assertFalse(response.streaming)
+
+    def test_invalid_or_disabled(self):
+        self.assertEqual(self.client.get('/api/events/?after=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/events/?wait=60').status_code, 400)
+        with override_settings(EVENT_LOG_BACKEND=''):
+            self.assertEqual(self.client.get('/api/events/').status_code, 404)
+
+
+class ColumnarSerialization(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand \u2028 é", daily_budget=100.00, monthly_budget=200.5, daily_spend=None)
+        Ad.objects.create(brand=brand, name="Ad 1", start_time=datetime(2023, 1, 1, 9, 0, 0, 123456), end_time=datetime(2023, 1, 1, 17, 0))
+        Ad.objects.create(brand=brand, name="Ad \u2029", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 2, 17, 0), last_active_time=timezone.now())
+
+    def test_same_bytes_as_the_serializers(self):
+        for serializer_class in (AdSerializer, BrandSerializer):
+            plan = field_plan(serializer_class)
+            queryset = serializer_class.Meta.model.objects.order_by('pk')
+            expected = serializer_class(list(queryset), many=True).data
+            data = plan.serialize(queryset.values_list(*plan.columns))
+            self.assertEqual(data, expected)
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_unsupported_serializers(self):
+        self.assertIsNone(field_plan(BrandWithAdsSerializer))
+        self.assertIsNone(field_plan(SpendPointSerializer))
+
+    def test_renderer_matches_drf(self):
+        for data in (
+            {'at': timezone.now(), 'day': timezone.now().date(), 'amount': Decimal('1.50'), 'text': "a\u2028b é"},
+            [{'detail': ErrorDetail("Not found.", code='not_found')}, None, True, 2 ** 70],
+            {1: 'non-string key'},
+        ):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(FastJSONRenderer().render({'a': [1]}, indented), JSONRenderer().render({'a': [1]}, indented))
+
+    def test_lists_read_rows(self):
+        with self.assertNumQueries(1):
+            page = self.client.get('/api/ads/').json()
+        self.assertEqual(page['results'], AdSerializer(Ad.objects.order_by('pk'), many=True).data)
+
+    def test_benchmark_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_serializers', '--brands', '2', '--ads-per-brand', '2', '--repeat', '1', stdout=out)
+        self.assertEqual(
+            [line.split(':')[0] for line in out.getvalue().splitlines()],
+            ['ads serializer', 'ads columnar', 'brands serializer', 'brands columnar'],
+        )
+        self.assertEqual(Brand.objects.count(), 1)
+
+
+class SparseFieldsets(TestCase):
+    def setUp(self):
+        self.brand = Brand.objects.create(name="Brand 1", daily_budget=100.00, monthly_budget=200.00)
+        for i in range(3):
+            Ad.objects.create(brand=self.brand, name=f"Ad {i}", start_time=datetime(2023, 1, 1, 9, 0), end_time=datetime(2023, 1, 1, 17, 0))
+
+    def get(self, url, num):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), num)
+        return response, [query['sql'] for query in queries]
+
+    def test_list_selects_only_the_fields_asked_for(self):
+        response, (sql,) = self.get('/api/ads/?fields=id,active&page_size=2', 1)
+        page = response.json()
+        self.assertEqual(page['results'], [{'id': ad.pk, 'active': False} for ad in Ad.objects.order_by('pk')[:2]])
+        self.assertNotIn('"name"', sql)
+        # Pages still follow on without the id.
+        page = self.client.get(page['next'].replace('id%2Cactive', 'active')).json()
+        self.assertEqual(page['results'], [{'active': False}])
+
+    def test_embedded_ads(self):
+        response, (brands_sql, ads_sql) = self.get('/api/brands/?expand=ads&fields=name,ads.id', 2)
+        ads = [{'id': ad.pk} for ad in Ad.objects.order_by('pk')]
+        self.assertEqual(response.json()['results'], [{'ads': ads, 'name': "Brand 1"}])
+        self.assertNotIn('"daily_budget"', brands_sql)
+        self.assertNotIn('"start_time"', ads_sql)
+
+    def test_detail(self):
+        full = self.client.get(f'/api/brands/{self.brand.pk}/')
+        response, (sql,) = self.get(f'/api/brands/{self.brand.pk}/?fields=name,daily_spend', 1)
+        self.assertEqual(response.json(), {'name': "Brand 1", 'daily_spend': '0.00'})
+        self.assertNotIn('"monthly_budget"', sql)
+        self.assertNotEqual(response['ETag'], full['ETag'])
+
+    def test_unknown_fields_and_writes(self):
+        response = self.client.get('/api/ads/?fields=id,bogus,ads.id')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ["Unknown field 'bogus'.", "Unknown field 'ads.id'."]})
+
+        payload = {'name': "Ad 4", 'brand': self.brand.pk, 'start_time': '2023-01-01T09:00:00Z', 'end_time': '2023-01-01T17:00:00Z'}
+        response = self.client.post('/api/ads/?fields=id', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], "Ad 4")
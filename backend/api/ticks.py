@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+from django.conf import settings
+from .backends import load_backend
+from .metrics import TASK_RUNS
+
+logger = logging.getLogger(__name__)
+
+# KEYS: lock key; ARGV: token. Only the holder may release the lock.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+STAT_FIELDS = ('runs', 'skipped', 'last_started_at', 'last_duration', 'max_duration', 'total_duration', 'last_lag', 'max_lag')
+
+
+class TickStore:
+    """Locks and run statistics shared by every worker running periodic tasks."""
+
+    def acquire(self, name, ttl):
+        """Return a token if the lock for `name` was free, else None."""
+        raise NotImplementedError
+
+    def release(self, name, token):
+        raise NotImplementedError
+
+    def last_started_at(self, name):
+        raise NotImplementedError
+
+    def record_run(self, name, started_at, duration, lag):
+        raise NotImplementedError
+
+    def record_skip(self, name):
+        raise NotImplementedError
+
+    def stats(self):
+        """Return `{name: {stat: value}}` for every task seen."""
+        raise NotImplementedError
+
+
+class LocalTickStore(TickStore):
+    """Process-local store, for tests and single-worker setups."""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._locks = {}
+        self._stats = {}
+
+    def _stat(self, name):
+        return self._stats.setdefault(name, dict.fromkeys(STAT_FIELDS, 0))
+
+    def acquire(self, name, ttl):
+        with self._lock:
+            token, expires = self._locks.get(name, (None, 0))
+            if token and expires > time.monotonic():
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, time.monotonic() + ttl)
+            return token
+
+    def release(self, name, token):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+    def last_started_at(self, name):
+        with self._lock:
+            return self._stats.get(name, {}).get('last_started_at') or None
+
+    def record_run(self, name, started_at, duration, lag):
+        with self._lock:
+            stat = self._stat(name)
+            stat['runs'] += 1
+            stat['last_started_at'] = started_at
+            stat['last_duration'] = duration
+            stat['max_duration'] = max(stat['max_duration'], duration)
+            stat['total_duration'] += duration
+            stat['last_lag'] = lag
+            stat['max_lag'] = max(stat['max_lag'], lag)
+
+    def record_skip(self, name):
+        with self._lock:
+            self._stat(name)['skipped'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stat) for name, stat in self._stats.items()}
+
+
+class RedisTickStore(TickStore):
+    """Locks are `SET NX PX` keys, statistics one hash per task."""
+
+    def __init__(self, url=None, prefix='ticks', **options):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.TICK_GUARD_URL, decode_responses=True)
+        self.prefix = prefix
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    def acquire(self, name, ttl):
+        token = uuid.uuid4().hex
+        if self.client.set(f'{self.prefix}:lock:{name}', token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release(self, name, token):
+        self._release(keys=[f'{self.prefix}:lock:{name}'], args=[token])
+
+    def last_started_at(self, name):
+        value = self.client.hget(f'{self.prefix}:stats:{name}', 'last_started_at')
+        return float(value) if value else None
+
+    def record_run(self, name, started_at, duration, lag):
+        key = f'{self.prefix}:stats:{name}'
+        with self.client.pipeline() as pipe:
+            pipe.sadd(f'{self.prefix}:names', name)
+            pipe.hincrby(key, 'runs', 1)
+            pipe.hset(key, mapping={'last_started_at': started_at, 'last_duration': duration, 'last_lag': lag})
+            pipe.hincrbyfloat(key, 'total_duration', duration)
+            pipe.execute()
+        # Maxima are only ever raised, a lost race just records the smaller one.
+        current = self.client.hmget(key, 'max_duration', 'max_lag')
+        if duration > float(current[0] or 0):
+            self.client.hset(key, 'max_duration', duration)
+        if lag > float(current[1] or 0):
+            self.client.hset(key, 'max_lag', lag)
+
+    def record_skip(self, name):
+        with self.client.pipeline() as pipe:
+            pipe.sadd(f'{self.prefix}:names', name)
+            pipe.hincrby(f'{self.prefix}:stats:{name}', 'skipped', 1)
+            pipe.execute()
+
+    def stats(self):
+        stats = {}
+        for name in sorted(self.client.smembers(f'{self.prefix}:names')):
+            values = self.client.hgetall(f'{self.prefix}:stats:{name}')
+            stats[name] = {field: float(values.get(field, 0)) for field in STAT_FIELDS}
+            stats[name]['runs'] = int(stats[name]['runs'])
+            stats[name]['skipped'] = int(stats[name]['skipped'])
+        return stats
+
+
+def get_tick_store():
+    return load_backend('TICK_GUARD_BACKEND')
+
+
+def tick_guard(name, interval=None):
+    """
+    Make a periodic task single-flight.
+
+    A run that finds the previous one still going is skipped, which also
+    coalesces ticks that piled up behind a slow run. Every run records its
+    duration and its lag: how late it started after `interval` seconds
+    (default `TICK_INTERVAL`) since the previous run.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            store = get_tick_store()
+            token = store.acquire(name, settings.CELERY_TASK_TIME_LIMIT)
+            if token is None:
+                store.record_skip(name)
+                TASK_RUNS.labels(name, 'skipped').inc()
+                logger.info(f"Tick {name} skipped, previous run still in progress.")
+                return None
+
+            started_at = time.time()
+            previous = store.last_started_at(name)
+            expected = interval or settings.TICK_INTERVAL
+            lag = max(started_at - previous - expected, 0.0) if previous else 0.0
+            try:
+                return func(*args, **kwargs)
+            finally:
+                store.record_run(name, started_at, time.time() - started_at, lag)
+                store.release(name, token)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,99 @@
+import heapq
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from .models import Ad
+
+PLANNED_UNTIL_KEY = 'timeline:planned-until'
+# Ads stay active through `end_time` itself, so they are stopped just after it.
+DEACTIVATION_DELAY = timedelta(seconds=1)
+# Leave the brand rollup a moment to reset daily spend before re-evaluating.
+ROLLOVER_DELAY = timedelta(seconds=5)
+# Sorts before every real ad id at the same instant.
+ROLLOVER = 0
+
+
+def next_transitions(start, end, ads=None):
+    """
+    Instants in (start, end] at which some ad changes state.
+
+    Returns `[(instant, ad_ids)]` in time order. `ad_ids` is None for a day
+    rollover, where budgets reset and every ad has to be re-evaluated.
+    """
+    ads = Ad.objects.all() if ads is None else ads
+    heap = []
+
+    rows = ads.filter(
+        Q(start_time__gt=start, start_time__lte=end)
+        | Q(end_time__gt=start - DEACTIVATION_DELAY, end_time__lte=end - DEACTIVATION_DELAY)
+    ).values_list('id', 'start_time', 'end_time')
+    for ad_id, start_time, end_time in rows:
+        for instant in (start_time, end_time + DEACTIVATION_DELAY):
+            if start < instant <= end:
+                heapq.heappush(heap, (instant, ad_id))
+
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0) + ROLLOVER_DELAY
+    if midnight <= start:
+        midnight += timedelta(days=1)
+    while midnight <= end:
+        heapq.heappush(heap, (midnight, ROLLOVER))
+        midnight += timedelta(days=1)
+
+    plan = []
+    while heap:
+        instant, ad_id = heapq.heappop(heap)
+        if not plan or plan[-1][0] != instant:
+            plan.append((instant, None if ad_id == ROLLOVER else [ad_id]))
+        elif plan[-1][1] is not None:
+            plan[-1][1].append(ad_id)
+    return plan
+
+
+def plan_timeline(now=None, horizon=None):
+    """
+    Dispatch one ETA task per upcoming transition instant up to `now + 2 * horizon`.
+
+    Runs every `horizon`, so each run resumes inside what the previous one
+    planned and only adds the instants past it. Only when that plan already
+    ran out (the planner missed a whole period) are missed transitions
+    applied at once.
+    """
+    from .tasks import task_apply_transitions
+
+    now = now or timezone.now()
+    # Planning a period ahead of the next run keeps a late beat from leaving a gap.
+    end = now + 2 * timedelta(seconds=horizon or settings.AD_TIMELINE_HORIZON)
+    start = cache.get(PLANNED_UNTIL_KEY)
+
+    if start is None or start < now:
+        task_apply_transitions.delay()
+        start = now
+    if start >= end:
+        return 0
+
+    plan = next_transitions(start, end)
+    for instant, ad_ids in plan:
+        task_apply_transitions.apply_async(kwargs={'ad_ids': ad_ids}, eta=instant)
+
+    cache.set(PLANNED_UNTIL_KEY, end, None)
+    return len(plan)
+
+
+def replan_ads(ad_ids, now=None):
+    """Apply the current state of edited ads now and schedule their transitions inside the planned horizon."""
+    from .tasks import task_apply_transitions
+
+    now = now or timezone.now()
+    ad_ids = list(ad_ids)
+    if not ad_ids:
+        return
+
+    task_apply_transitions.delay(ad_ids=ad_ids)
+
+    planned_until = cache.get(PLANNED_UNTIL_KEY)
+    if planned_until and planned_until > now:
+        for instant, ids in next_transitions(now, planned_until, Ad.objects.filter(pk__in=ad_ids)):
+            if ids:
+                task_apply_transitions.apply_async(kwargs={'ad_ids': ids}, eta=instant)
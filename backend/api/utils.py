@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+from django.db import transaction
+
+
+def chunks(iterable, size):
+    """Lists of `size` consecutive items of `iterable`, the last one possibly shorter."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def rolled_back(rollback=True):
+    """Run the block in a transaction that is rolled back when it ends, unless `rollback` is False."""
+    with transaction.atomic():
+        yield
+        if rollback:
+            transaction.set_rollback(True)
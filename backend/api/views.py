@@ -1,3 +1,7 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .metrics import metrics_registry
 
-# Create your views here.
+
+def metrics(request):
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -1,15 +1,196 @@
-from rest_framework import viewsets
+import codecs
+from django.db.models import F, Prefetch
+from django.http import Http404, StreamingHttpResponse
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from .analytics import brand_spend_history
+from .brand_state import get_brand_state, get_brand_states
+from .conditional import ConditionalReadMixin
+from .bulk import bulk_write_ads
+from .ingest import CHUNK_SIZE, READERS, ingest_adspend
+from .export import ADSPEND_COLUMNS, BRAND_SPEND_COLUMNS, CONTENT_TYPES, adspend_rows, brand_spend_rows, render
+from .fieldsets import SparseFieldsMixin, deferred_columns
 from .models import Settings, Brand, Ad
-from .serializers import SettingsSerializer, BrandSerializer, AdSerializer
+from .renderers import FastJSONRenderer
+from .serializers import (
+    SettingsSerializer, BrandSerializer, BrandWithAdsSerializer, AdSerializer,
+    SpendQuerySerializer, BulkSpendQuerySerializer, SpendPointSerializer, ExportQuerySerializer,
+    IngestQuerySerializer, BrandBudgetQuerySerializer, BrandStateSerializer,
+)
+from .ticks import get_tick_store
 
 class SettingsViewSet(viewsets.ModelViewSet):
     queryset = Settings.objects.all()
     serializer_class = SettingsSerializer
 
-class BrandViewSet(viewsets.ModelViewSet):
+class BrandReadMixin(SparseFieldsMixin):
+    """
+    Brand reads shared by `BrandViewSet` and the async brand views: `?expand=ads`
+    embeds the ads, fetched in one extra query per page; `&ads_limit=N` keeps
+    only the first N of each brand. `?fields=` narrows both, see `SparseFieldsMixin`.
+    """
+    max_ads_limit = 1000
+
+    def expand_ads(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return False
+        return 'ads' in self.request.query_params.get('expand', '').split(',')
+
+    def ads_limit(self):
+        value = self.request.query_params.get('ads_limit')
+        if value is None:
+            return None
+        field = serializers.IntegerField(min_value=1, max_value=self.max_ads_limit)
+        try:
+            return field.run_validation(value)
+        except serializers.ValidationError as exc:
+            raise serializers.ValidationError({'ads_limit': exc.detail})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.expand_ads():
+            ads = Ad.objects.order_by('id')
+            ad_fields = self.sparse_fields().get('ads')
+            if ad_fields:
+                # The prefetch matches ads to their brand by `brand`.
+                ads = ads.defer(*deferred_columns(AdSerializer, ad_fields, keep=('brand',)))
+            limit = self.ads_limit()
+            if limit:
+                ads = ads[:limit]
+            queryset = queryset.prefetch_related(Prefetch('ads', queryset=ads, to_attr='embedded_ads'))
+        return queryset
+
+    def full_serializer_class(self):
+        return BrandWithAdsSerializer if self.expand_ads() else BrandSerializer
+
+    def serialize_spend_history(self, history, granularity):
+        context = {'granularity': granularity}
+        return [
+            {
+                'brand': brand_id,
+                'granularity': granularity,
+                'spend': SpendPointSerializer(
+                    [{'period': period, 'spent': spent} for period, spent in points], many=True, context=context
+                ).data,
+            }
+            for brand_id, points in history.items()
+        ]
+
+class BrandViewSet(ConditionalReadMixin, BrandReadMixin, viewsets.ModelViewSet):
+    """Brands without their ads by default, see `BrandReadMixin` for `?expand=ads`."""
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+    version_columns = ('version', 'last_modified')
+
+    def item_version(self, obj):
+        return obj.version, obj.last_modified
+
+    def spend_history(self, brand_ids, query):
+        granularity = query['granularity']
+        history = brand_spend_history(brand_ids, granularity, query.get('from'), query.get('to'))
+        return self.serialize_spend_history(history, granularity)
+
+    @action(detail=True)
+    def budget(self, request, pk=None):
+        """Budgets, current spend and whether the brand can spend, from the brand state cache."""
+        try:
+            state = get_brand_state(int(pk))
+        except ValueError:
+            state = None
+        if state is None:
+            raise Http404
+        return Response(BrandStateSerializer(state).data)
+
+    @action(detail=False, url_path='budget')
+    def bulk_budget(self, request):
+        query = BrandBudgetQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        states = get_brand_states(query.validated_data['brand'])
+        return Response(BrandStateSerializer([state for _, state in sorted(states.items())], many=True).data)
+
+    @action(detail=True)
+    def spend(self, request, pk=None):
+        """`?granularity=day|month&from=YYYY-MM-DD&to=YYYY-MM-DD`"""
+        query = SpendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(self.spend_history([self.get_object().pk], query.validated_data)[0])
+
+    @action(detail=False, url_path='spend')
+    def bulk_spend(self, request):
+        """Same as `spend` for every `?brand=` given; unknown brands are left out."""
+        query = BulkSpendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        brand_ids = list(
+            Brand.objects.filter(pk__in=query.validated_data['brand']).order_by('pk').values_list('pk', flat=True)
+        )
+        return Response(self.spend_history(brand_ids, query.validated_data))
 
-class AdViewSet(viewsets.ModelViewSet):
+class AdViewSet(ConditionalReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Ad.objects.all()
-    serializer_class = AdSerializer
\ No newline at end of file
+    serializer_class = AdSerializer
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+    version_columns = ('brand_version', 'brand_last_modified')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Ad writes bump their brand, so the brand's stamps version the ad too.
+            queryset = queryset.annotate(brand_version=F('brand__version'), brand_last_modified=F('brand__last_modified'))
+        return queryset
+
+    def item_version(self, obj):
+        return obj.brand_version, obj.brand_last_modified
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """`{"create": [ad], "update": [{"id", ...}], "pause": [id], "resume": [id]}`, all or nothing."""
+        return Response(bulk_write_ads(request.data))
+
+class TickStatsViewSet(viewsets.ViewSet):
+    # Runs, skips, durations (seconds) and start lag of each periodic task.
+    def list(self, request):
+        return Response(get_tick_store().stats())
+
+class ExportViewSet(viewsets.ViewSet):
+    """Full spend history streamed as `?output=csv|ndjson`, filtered by `from`, `to` and repeated `brand`."""
+
+    def stream(self, request, name, columns, rows):
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        output = params['output']
+
+        response = StreamingHttpResponse(
+            render(output, columns, rows(params.get('from'), params.get('to'), params.get('brand'))),
+            content_type=CONTENT_TYPES[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+        return response
+
+    @action(detail=False)
+    def adspend(self, request):
+        return self.stream(request, 'adspend', ADSPEND_COLUMNS, adspend_rows)
+
+    @action(detail=False, url_path='brand-spend')
+    def brand_spend(self, request):
+        return self.stream(request, 'brand-spend', BRAND_SPEND_COLUMNS, brand_spend_rows)
+
+class IngestViewSet(viewsets.ViewSet):
+    @action(detail=False, methods=['post'])
+    def adspend(self, request):
+        """
+        Upsert reported spend from the raw request body, `?input=csv|ndjson`.
+
+        The body is read line by line, never loaded whole. Rejected records are
+        listed by line number and don't stop the rest of the import.
+        """
+        query = IngestQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        lines = codecs.iterdecode(request.stream or [], 'utf-8-sig')
+        result = ingest_adspend(READERS[params['input']](lines), params.get('chunk_size', CHUNK_SIZE))
+        return Response(result.as_dict())